@@ -0,0 +1,25 @@
+import os
+from contextlib import contextmanager
+
+# Output files are written next to their final path and only moved in place once they are complete. A failed write
+# keeps the previous file, and scripts reading the file at the same time never see a half-written one.
+
+def get_temp_path(output_path):
+    return f"{output_path}.{os.getpid()}.tmp"
+
+def remove_temp_file(temp_path):
+    try:
+        os.remove(temp_path)
+    except OSError:
+        pass
+
+@contextmanager
+def atomic_write(output_path, mode='w', encoding=None, newline=None):
+    temp_path = get_temp_path(output_path)
+    try:
+        with open(temp_path, mode, encoding=encoding, newline=newline) as output_file:
+            yield output_file
+        os.replace(temp_path, output_path)
+    except BaseException:
+        remove_temp_file(temp_path)
+        raise
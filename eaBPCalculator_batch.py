@@ -0,0 +1,144 @@
+import os
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from eaBPCalculator_database import get_database_paths, load_database
+from eaBPCalculator_exportBPComps import build_block_index, parse_input_files, parse_component_counts, write_output_file
+from eaBPCalculator_exportBPComps import read_grid_blocks, stream_grid_blocks
+from eaBPCalculator_exportBPComps import your_contentBlacklist_folder, your_streamingBlueprint_parsing
+from eaBPCalculator_exportBPMats import build_recipe_index, calculate_totals, new_expansion_cache, write_output
+from eaBPCalculator_vectorized import numpy_available, build_block_matrix, build_material_matrix
+from eaBPCalculator_vectorized import compute_component_counts, calculate_totals_vectorized
+
+# Batch mode: loads the Database once and exports components and materials for many blueprint folders in one run.
+# Every blueprint gets its own "<folder>_exportComponents.xml" and "<folder>_exportMaterials.xml", and the merged
+# result of all of them is written to "exportComponents.xml" and "exportMaterials.xml" in the output folder.
+# Example:
+# python eaBPCalculator_batch.py "C:\Users\MyPC\AppData\Roaming\SpaceEngineers\Blueprints\local\*" --workers 4
+# With NumPy installed, --numpy computes every grid of a blueprint with matrix products instead of per-item loops.
+
+# Indexes of this process, loaded once and reused for every blueprint
+block_index = None
+recipe_index = None
+expansion_cache = None
+grid_cache = None
+block_matrix = None
+material_matrix = None
+
+def load_indexes(script_dir, use_numpy=False):
+    global block_index, recipe_index, expansion_cache, grid_cache, block_matrix, material_matrix
+    db_file_path, cache_file_path = get_database_paths(script_dir)
+    if not os.path.exists(db_file_path):
+        print("Database file 'parsedData.xml' not found. Stopping execution.")
+        exit(1)
+    components, blueprints, cube_blocks = load_database(db_file_path, cache_file_path)
+    block_index = build_block_index(cube_blocks)
+    recipe_index = build_recipe_index(components, blueprints)
+    expansion_cache = new_expansion_cache()
+    grid_cache = {}
+    if use_numpy:
+        block_matrix = build_block_matrix(block_index)
+        material_matrix = build_material_matrix(recipe_index, expansion_cache)
+
+# Expand folder paths and glob patterns into blueprint folders, keeping the given order. Existing folders are taken
+# as they are, so names with brackets like "[Ship] v2" are not read as a glob character class.
+def find_blueprint_folders(patterns):
+    blueprint_folders = []
+    for pattern in patterns:
+        paths = [pattern] if os.path.isdir(pattern) else sorted(glob.glob(pattern))
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.isdir(path) and path not in blueprint_folders:
+                blueprint_folders.append(path)
+    return blueprint_folders
+
+# Output file prefix for every blueprint folder, numbered when two folders share a name
+def get_output_names(blueprint_folders):
+    output_names = []
+    for blueprint_folder in blueprint_folders:
+        folder_name = os.path.basename(os.path.normpath(blueprint_folder))
+        output_name = folder_name
+        number = 1
+        while output_name in output_names:
+            number += 1
+            output_name = f"{folder_name}_{number}"
+        output_names.append(output_name)
+    return output_names
+
+def process_blueprint(blueprint_folder, output_name, output_dir, streaming=True, use_numpy=False):
+    input_files = parse_input_files({'blueprintFolder': blueprint_folder}, your_contentBlacklist_folder)
+    if use_numpy:
+        grids = []
+        for input_file in input_files:
+            grids.extend(stream_grid_blocks(input_file) if streaming else read_grid_blocks(input_file))
+        counts = compute_component_counts(grids, block_matrix)
+        categorized_totals, total = calculate_totals_vectorized(counts, recipe_index, material_matrix)
+    else:
+        counts = {}
+        for input_file in input_files:
+            counts = parse_component_counts(input_file, block_index, counts, streaming, grid_cache)
+        categorized_totals, total = calculate_totals(counts, recipe_index, expansion_cache)
+    write_output_file(counts, os.path.join(output_dir, f"{output_name}_exportComponents.xml"))
+    write_output(categorized_totals, total, os.path.join(output_dir, f"{output_name}_exportMaterials.xml"))
+    return counts
+
+# Merge blueprint counts by grid DisplayName, the same way exportBPComps merges several bp.sbc files
+def merge_counts(counts, blueprint_counts):
+    for display_name, components in blueprint_counts.items():
+        grid_counts = counts.setdefault(display_name, {})
+        for subtype, count in components.items():
+            grid_counts[subtype] = grid_counts.get(subtype, 0) + count
+    return counts
+
+def run_batch(blueprint_folders, output_dir, workers=1, streaming=True, use_numpy=False):
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    if use_numpy and not numpy_available():
+        print("NumPy is not installed, using the pure Python calculation.")
+        use_numpy = False
+    os.makedirs(output_dir, exist_ok=True)
+    load_indexes(script_dir, use_numpy)
+
+    output_names = get_output_names(blueprint_folders)
+    output_dirs = [output_dir] * len(blueprint_folders)
+    streaming_flags = [streaming] * len(blueprint_folders)
+    numpy_flags = [use_numpy] * len(blueprint_folders)
+    if workers == 1 or len(blueprint_folders) < 2:
+        blueprint_results = list(map(process_blueprint, blueprint_folders, output_names, output_dirs, streaming_flags, numpy_flags))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=load_indexes, initargs=(script_dir, use_numpy)) as executor:
+            blueprint_results = list(executor.map(process_blueprint, blueprint_folders, output_names, output_dirs, streaming_flags, numpy_flags))
+
+    counts = {}
+    for blueprint_counts in blueprint_results:
+        merge_counts(counts, blueprint_counts)
+    if use_numpy:
+        categorized_totals, total = calculate_totals_vectorized(counts, recipe_index, material_matrix)
+    else:
+        categorized_totals, total = calculate_totals(counts, recipe_index, expansion_cache)
+    write_output_file(counts, os.path.join(output_dir, 'exportComponents.xml'))
+    write_output(categorized_totals, total, os.path.join(output_dir, 'exportMaterials.xml'))
+    print(f"Processed {len(blueprint_folders)} blueprints.")
+
+def worker_count(value):
+    workers = int(value)
+    if workers < 0:
+        raise argparse.ArgumentTypeError("must be 0 or more")
+    return workers
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Export components and materials for many blueprint folders in one run.")
+    parser.add_argument('blueprints', nargs='+', help="blueprint folders or glob patterns, e.g. \"Blueprints/local/*\"")
+    parser.add_argument('--output-dir', default=os.path.join(script_dir, 'batchExport'), help="folder for the exported files")
+    parser.add_argument('--workers', type=worker_count, default=1, help="number of worker processes, 0 uses every CPU core")
+    parser.add_argument('--numpy', action='store_true', help="compute with NumPy matrix products when NumPy is installed")
+    args = parser.parse_args()
+
+    blueprint_folders = find_blueprint_folders(args.blueprints)
+    if not blueprint_folders:
+        print("No blueprint folders found. Stopping execution.")
+        exit(1)
+    run_batch(blueprint_folders, args.output_dir, args.workers or None, your_streamingBlueprint_parsing, args.numpy)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from eaBPCalculator_parsingPart import parse_sbc_files, write_to_output_file
+from eaBPCalculator_database import get_source_signature, write_database_cache, load_database
+from eaBPCalculator_exportBPComps import build_block_index, parse_input_files, parse_component_counts, write_output_file
+from eaBPCalculator_exportBPMats import build_recipe_index, calculate_totals, write_output
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+if sys.platform == 'win32':
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+# Benchmark with synthetic game, mod and blueprint files, so the scripts can be measured without a game install.
+# Every stage is timed on its own and the results, with the peak memory of the process, are written as JSON.
+# "PeakRssSoFarKiB" of a stage is the peak of the whole process up to the end of that stage, not of the stage alone.
+# Add --tracemalloc for the peak Python memory of every single stage, timings are slower then.
+# Example:
+# python eaBPCalculator_benchmark.py --definitions 5000 --mods 200 --grids 10 --blocks 200000 --recipe-depth 4
+
+INGOTS = ['Iron', 'Nickel', 'Silicon', 'Cobalt', 'Gold', 'Silver', 'Platinum', 'Uranium', 'Magnesium']
+SBC_HEADER = '<?xml version="1.0"?>\n<Definitions xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+
+def write_text(file_path, text):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as output_file:
+        output_file.write(text)
+
+def component_xml(subtype_id):
+    return (f'<Component><Id><TypeId>Component</TypeId><SubtypeId>{subtype_id}</SubtypeId></Id>'
+            f'<DisplayName>DisplayName_Item_{subtype_id}</DisplayName></Component>\n')
+
+def blueprint_xml(subtype_id, prerequisites):
+    items = ''.join(f'<Item Amount="{amount}" TypeId="{type_id}" SubtypeId="{item_subtype}"/>' for amount, type_id, item_subtype in prerequisites)
+    return (f'<Blueprint><Id><TypeId>BlueprintDefinition</TypeId><SubtypeId>{subtype_id}Blueprint</SubtypeId></Id>'
+            f'<DisplayName>DisplayName_Item_{subtype_id}</DisplayName><Prerequisites>{items}</Prerequisites>'
+            f'<Result Amount="1" TypeId="Component" SubtypeId="{subtype_id}"/></Blueprint>\n')
+
+def cube_block_xml(subtype_id, cube_size, components):
+    items = ''.join(f'<Component Subtype="{subtype}" Count="{count}"/>' for subtype, count in components)
+    return (f'<Definition xsi:type="MyObjectBuilder_CubeBlockDefinition"><Id><TypeId>CubeBlock</TypeId><SubtypeId>{subtype_id}</SubtypeId></Id>'
+            f'<DisplayName>DisplayName_Block_{subtype_id}</DisplayName><CubeSize>{cube_size}</CubeSize><Components>{items}</Components></Definition>\n')
+
+# Components in recipe tiers: tier 0 is made from ingots, every higher tier also needs Components of the tier below
+def generate_components(rng, component_count, recipe_depth):
+    tiers = [[] for _ in range(max(1, recipe_depth))]
+    recipes = {}
+    for number in range(component_count):
+        tier = number % len(tiers)
+        subtype_id = f'BenchComponent{number}'
+        prerequisites = [(rng.randint(1, 30), 'Ingot', ingot) for ingot in rng.sample(INGOTS, rng.randint(1, 3))]
+        if tier > 0 and tiers[tier - 1]:
+            prerequisites += [(rng.randint(1, 4), 'Component', lower) for lower in rng.sample(tiers[tier - 1], min(2, len(tiers[tier - 1])))]
+        tiers[tier].append(subtype_id)
+        recipes[subtype_id] = prerequisites
+    return recipes
+
+# Game Content folder and mod folders with the block definitions spread over them. Some mods redefine vanilla blocks.
+def generate_content(base_dir, rng, definitions, mods, recipe_depth):
+    recipes = generate_components(rng, max(10, definitions // 20), recipe_depth)
+    component_ids = list(recipes)
+    block_ids = []
+    files = [[] for _ in range(mods + 1)]
+    for number in range(definitions):
+        if number and number % 7 == 0 and block_ids and mods:
+            subtype_id, cube_size = rng.choice(block_ids)
+        else:
+            subtype_id, cube_size = f'BenchBlock{number}', rng.choice(['Large', 'Small'])
+            block_ids.append((subtype_id, cube_size))
+        components = [(subtype, rng.randint(1, 50)) for subtype in rng.sample(component_ids, min(len(component_ids), rng.randint(1, 8)))]
+        files[0 if number < definitions // (mods + 1) else 1 + number % max(1, mods)].append(cube_block_xml(subtype_id, cube_size, components))
+
+    vanilla = ''.join(component_xml(subtype_id) for subtype_id in component_ids)
+    vanilla_blueprints = ''.join(blueprint_xml(subtype_id, prerequisites) for subtype_id, prerequisites in recipes.items())
+    content_folder = os.path.join(base_dir, 'Content')
+    write_text(os.path.join(content_folder, 'Data', 'Components.sbc'), f'{SBC_HEADER}<Components>\n{vanilla}</Components>\n</Definitions>\n')
+    write_text(os.path.join(content_folder, 'Data', 'Blueprints.sbc'), f'{SBC_HEADER}<Blueprints>\n{vanilla_blueprints}</Blueprints>\n</Definitions>\n')
+    write_text(os.path.join(content_folder, 'Data', 'CubeBlocks', 'CubeBlocks.sbc'), f'{SBC_HEADER}<CubeBlocks>\n{"".join(files[0])}</CubeBlocks>\n</Definitions>\n')
+
+    mod_folder = os.path.join(base_dir, 'Mods')
+    for mod_number in range(mods):
+        write_text(os.path.join(mod_folder, str(3000000000 + mod_number), 'Data', 'CubeBlocks.sbc'),
+                   f'{SBC_HEADER}<CubeBlocks>\n{"".join(files[1 + mod_number])}</CubeBlocks>\n</Definitions>\n')
+
+    folders = {'vanillaGamePath': content_folder}
+    if mods:
+        folders['modFolder1'] = mod_folder
+    return folders, block_ids
+
+# One bp.sbc with the blocks spread over several grids, written piece by piece so huge blueprints fit in memory
+def generate_blueprint(base_dir, rng, block_ids, grids, blocks):
+    blueprint_folder = os.path.join(base_dir, 'Blueprints', 'BenchBlueprint')
+    os.makedirs(blueprint_folder, exist_ok=True)
+    with open(os.path.join(blueprint_folder, 'bp.sbc'), 'w', encoding='utf-8') as bp_file:
+        bp_file.write(f'{SBC_HEADER}<ShipBlueprints><ShipBlueprint xsi:type="MyObjectBuilder_ShipBlueprintDefinition">'
+                      '<DisplayName>Benchmark</DisplayName><CubeGrids>\n')
+        for grid_number in range(grids):
+            grid_size = 'Large' if grid_number % 2 == 0 else 'Small'
+            bp_file.write(f'<CubeGrid><SubtypeName /><GridSizeEnum>{grid_size}</GridSizeEnum><CubeBlocks>\n')
+            for block_number in range(blocks // grids + (1 if grid_number < blocks % grids else 0)):
+                subtype_id = rng.choice(block_ids)[0]
+                bp_file.write(f'<MyObjectBuilder_CubeBlock xsi:type="MyObjectBuilder_CubeBlock"><SubtypeName>{subtype_id}</SubtypeName>'
+                              f'<Min x="{block_number}" y="0" z="0" /><BuiltBy>144115188075855895</BuiltBy></MyObjectBuilder_CubeBlock>\n')
+            bp_file.write(f'</CubeBlocks><DisplayName>BenchGrid{grid_number}</DisplayName></CubeGrid>\n')
+        bp_file.write('</CubeGrids></ShipBlueprint></ShipBlueprints>\n</Definitions>\n')
+    return {'blueprintFolder1': blueprint_folder}
+
+# Peak resident memory of this process so far, in KiB. On Windows this is the peak working set.
+def get_peak_rss_kib():
+    if resource is not None:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak_rss // 1024 if sys.platform == 'darwin' else peak_rss
+    if sys.platform == 'win32':
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+        get_process_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+        get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+        get_current_process.restype = wintypes.HANDLE
+        if get_process_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize // 1024
+    return None
+
+def run_benchmark(base_dir, definitions, mods, grids, blocks, recipe_depth, workers=1, seed=1, trace_memory=False):
+    rng = random.Random(seed)
+    stages = []
+    if trace_memory:
+        tracemalloc.start()
+
+    def timed(name, function, *args):
+        if trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = function(*args)
+        stage = {'Name': name, 'Seconds': time.perf_counter() - start, 'PeakRssSoFarKiB': get_peak_rss_kib()}
+        if trace_memory:
+            stage['PeakTracedKiB'] = tracemalloc.get_traced_memory()[1] // 1024
+        stages.append(stage)
+        return result
+
+    content_folders, block_ids = timed('generate_content', generate_content, base_dir, rng, definitions, mods, recipe_depth)
+    blueprint_folders = timed('generate_blueprint', generate_blueprint, base_dir, rng, block_ids, grids, blocks)
+    generation_seconds = sum(stage['Seconds'] for stage in stages)
+
+    db_file_path = os.path.join(base_dir, 'parsedData.xml')
+    cache_file_path = os.path.join(base_dir, 'parsedData.cache')
+    components, blueprints, cube_blocks = timed('parse_sbc_files', parse_sbc_files, content_folders, {}, workers)
+    timed('write_to_output_file', write_to_output_file, db_file_path, components, blueprints, cube_blocks)
+    timed('write_database_cache', write_database_cache, cache_file_path, get_source_signature(db_file_path),
+          components, blueprints, cube_blocks)
+
+    components, blueprints, cube_blocks = timed('load_database', load_database, db_file_path, cache_file_path)
+    block_index = timed('build_block_index', build_block_index, cube_blocks)
+    input_files = timed('parse_input_files', parse_input_files, blueprint_folders, {})
+    counts = {}
+    for input_file in input_files:
+        counts = timed('parse_component_counts', parse_component_counts, input_file, block_index, counts)
+    timed('write_output_file', write_output_file, counts, os.path.join(base_dir, 'exportComponents.xml'))
+
+    recipe_index = timed('build_recipe_index', build_recipe_index, components, blueprints)
+    categorized_totals, total = timed('calculate_totals', calculate_totals, counts, recipe_index)
+    timed('write_output', write_output, categorized_totals, total, os.path.join(base_dir, 'exportMaterials.xml'))
+    if trace_memory:
+        tracemalloc.stop()
+
+    return {
+        'Parameters': {
+            'Definitions': definitions, 'Mods': mods, 'Grids': grids, 'Blocks': blocks,
+            'RecipeDepth': recipe_depth, 'Workers': workers, 'Seed': seed, 'TraceMemory': trace_memory
+        },
+        'Python': platform.python_version(),
+        'Platform': platform.platform(),
+        'Stages': stages,
+        'TotalSeconds': sum(stage['Seconds'] for stage in stages) - generation_seconds,
+        'PeakRssKiB': get_peak_rss_kib()
+    }
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Time the calculator on synthetic game, mod and blueprint files.")
+    parser.add_argument('--definitions', type=int, default=2000, help="number of block definitions")
+    parser.add_argument('--mods', type=int, default=50, help="number of mod folders")
+    parser.add_argument('--grids', type=int, default=5, help="number of grids in the blueprint")
+    parser.add_argument('--blocks', type=int, default=100000, help="number of blocks over all grids")
+    parser.add_argument('--recipe-depth', type=int, default=3, help="number of Component tiers in the recipes")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes for parse_sbc_files, 0 uses every CPU core")
+    parser.add_argument('--seed', type=int, default=1, help="seed of the random generator")
+    parser.add_argument('--tracemalloc', action='store_true', help="record the peak Python memory of every stage (slower)")
+    parser.add_argument('--keep', help="generate the files into this folder and keep them")
+    parser.add_argument('--output', default=os.path.join(script_dir, 'benchmarkResults.json'), help="JSON results file")
+    args = parser.parse_args()
+
+    arguments = (args.definitions, args.mods, max(1, args.grids), args.blocks, args.recipe_depth, args.workers or None, args.seed, args.tracemalloc)
+    if args.keep:
+        results = run_benchmark(os.path.abspath(args.keep), *arguments)
+    else:
+        with tempfile.TemporaryDirectory() as base_dir:
+            results = run_benchmark(base_dir, *arguments)
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(results, output_file, indent=4)
+    for stage in results['Stages']:
+        traced = f", peak traced {stage['PeakTracedKiB']} KiB" if 'PeakTracedKiB' in stage else ''
+        print(f"{stage['Name']:<24}{stage['Seconds']:>10.3f} s{traced}")
+    print(f"{'total':<24}{results['TotalSeconds']:>10.3f} s, peak RSS {results['PeakRssKiB']} KiB")
+    print(f"Benchmark results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
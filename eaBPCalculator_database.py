@@ -0,0 +1,181 @@
+import os
+import sys
+import pickle
+from typing import NamedTuple, Optional
+import xml.etree.ElementTree as ET
+from eaBPCalculator_profiling import profiler
+from eaBPCalculator_atomicFile import atomic_write
+
+# Shared loading of the Database for the export scripts. Next to "parsedData.xml" a compact "parsedData.cache" is kept,
+# which stores the same records with every string interned into one table and referenced by integer ID.
+# The cache is only used while it matches the modification time and size of "parsedData.xml", so hand-edited
+# Database files are always picked up.
+
+CACHE_VERSION = 1
+
+# Records of the Database. Tuples need far less memory than dicts, and the repeated names inside them are interned.
+class ComponentRecord(NamedTuple):
+    SubtypeId: str
+    DisplayName: str
+
+class ItemRecord(NamedTuple):
+    SubtypeId: str
+    Amount: float
+    TypeId: str
+
+class ResultRecord(NamedTuple):
+    Amount: str
+    TypeId: str
+    SubtypeId: str
+
+class BlueprintRecord(NamedTuple):
+    SubtypeId: str
+    DisplayName: str
+    Prerequisites: tuple
+    Results: tuple
+    Result: Optional[ResultRecord]
+
+class BlockComponentRecord(NamedTuple):
+    Subtype: str
+    Count: int
+
+class CubeBlockRecord(NamedTuple):
+    SubtypeId: str
+    DisplayName: str
+    CubeSize: str
+    Components: tuple
+
+def intern_text(text):
+    return sys.intern(text) if text is not None else None
+
+def get_database_paths(script_dir):
+    return os.path.join(script_dir, 'parsedData.xml'), os.path.join(script_dir, 'parsedData.cache')
+
+def get_source_signature(db_file_path):
+    file_stat = os.stat(db_file_path)
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+# Read "parsedData.xml" into the same Component, Blueprint and Block records the parsing script produces
+def read_database_xml(db_file_path):
+    root = ET.parse(db_file_path).getroot()
+
+    components = []
+    for component in root.findall('./Components/Component'):
+        components.append(ComponentRecord(
+            intern_text(component.findtext('SubtypeId')),
+            intern_text(component.findtext('DisplayName'))
+        ))
+
+    blueprints = []
+    for bp in root.findall('./Blueprints/Blueprint'):
+        result = bp.find('Result')
+        blueprints.append(BlueprintRecord(
+            intern_text(bp.findtext('SubtypeId')),
+            intern_text(bp.findtext('DisplayName')),
+            read_items(bp.findall('./Prerequisites/Item')),
+            read_items(bp.findall('./Results/Item')),
+            ResultRecord(
+                result.get('Amount'),
+                intern_text(result.get('TypeId')),
+                intern_text(result.get('SubtypeId'))
+            ) if result is not None else None
+        ))
+
+    cube_blocks = []
+    for definition in root.findall('./CubeBlocks/Definition'):
+        cube_blocks.append(CubeBlockRecord(
+            intern_text(definition.findtext('SubtypeId')),
+            intern_text(definition.findtext('DisplayName')),
+            intern_text(definition.findtext('CubeSize')),
+            tuple(BlockComponentRecord(intern_text(component.get('Subtype')), int(component.get('Count')))
+                  for component in definition.findall('./Components/Component'))
+        ))
+
+    return components, blueprints, cube_blocks
+
+def read_items(items):
+    return tuple(ItemRecord(intern_text(item.get('SubtypeId')), float(item.get('Amount')), intern_text(item.get('TypeId'))) for item in items)
+
+# Store the records as tuples of string IDs, with the interned strings listed once. The source signature must be taken
+# before "parsedData.xml" is read, so a file replaced in between never gets a cache made from the older one.
+def write_database_cache(cache_path, source_signature, components, blueprints, cube_blocks):
+    string_ids = {}
+
+    def string_id(text):
+        return string_ids.setdefault(text, len(string_ids))
+
+    def item_ids(items):
+        return [(string_id(item.SubtypeId), string_id(item.TypeId), item.Amount) for item in items]
+
+    cache = {
+        'Version': CACHE_VERSION,
+        'Source': source_signature,
+        'Components': [(string_id(comp.SubtypeId), string_id(comp.DisplayName)) for comp in components],
+        'Blueprints': [(
+            string_id(bp.SubtypeId),
+            string_id(bp.DisplayName),
+            item_ids(bp.Prerequisites),
+            item_ids(bp.Results),
+            (string_id(bp.Result.Amount), string_id(bp.Result.TypeId), string_id(bp.Result.SubtypeId)) if bp.Result is not None else None
+        ) for bp in blueprints],
+        'CubeBlocks': [(
+            string_id(cb.SubtypeId),
+            string_id(cb.DisplayName),
+            string_id(cb.CubeSize),
+            [(string_id(component.Subtype), component.Count) for component in cb.Components]
+        ) for cb in cube_blocks],
+    }
+    cache['Strings'] = list(string_ids)
+
+    # Several scripts refresh the cache, so it is replaced in one step and never seen half written
+    try:
+        with atomic_write(cache_path, 'wb') as cache_file:
+            pickle.dump(cache, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print(f"Error writing cache file: {e}")
+
+# Returns None when the cache is missing, unreadable, from another version, or older than "parsedData.xml"
+def read_database_cache(cache_path, db_file_path):
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            cache = pickle.load(cache_file)
+    except Exception:
+        # A damaged pickle can raise almost anything, it is simply rebuilt from "parsedData.xml"
+        return None
+    if not isinstance(cache, dict) or cache.get('Version') != CACHE_VERSION:
+        return None
+    if cache['Source'] != get_source_signature(db_file_path):
+        return None
+
+    strings = [intern_text(text) for text in cache['Strings']]
+
+    def items(item_ids):
+        return tuple(ItemRecord(strings[subtype_id], amount, strings[type_id]) for subtype_id, type_id, amount in item_ids)
+
+    components = [ComponentRecord(strings[subtype_id], strings[display_name]) for subtype_id, display_name in cache['Components']]
+    blueprints = [BlueprintRecord(
+        strings[subtype_id],
+        strings[display_name],
+        items(prerequisites),
+        items(results),
+        ResultRecord(strings[result[0]], strings[result[1]], strings[result[2]]) if result is not None else None
+    ) for subtype_id, display_name, prerequisites, results, result in cache['Blueprints']]
+    cube_blocks = [CubeBlockRecord(
+        strings[subtype_id],
+        strings[display_name],
+        strings[cube_size],
+        tuple(BlockComponentRecord(strings[subtype], count) for subtype, count in block_components)
+    ) for subtype_id, display_name, cube_size, block_components in cache['CubeBlocks']]
+    return components, blueprints, cube_blocks
+
+# Load the Database from the cache, or from "parsedData.xml" when the cache is stale. The cache is refreshed after a fallback.
+def load_database(db_file_path, cache_path):
+    database = read_database_cache(cache_path, db_file_path)
+    if database is None:
+        profiler.count('database_cache_misses')
+        source_signature = get_source_signature(db_file_path)
+        database = read_database_xml(db_file_path)
+        write_database_cache(cache_path, source_signature, *database)
+    else:
+        profiler.count('database_cache_hits')
+    return database
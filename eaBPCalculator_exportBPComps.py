@@ -1,6 +1,12 @@
 import os
+import argparse
 import xml.etree.ElementTree as ET
-import xml.dom.minidom
+from eaBPCalculator_xmlWriter import IndentedXmlWriter
+from eaBPCalculator_atomicFile import atomic_write
+from eaBPCalculator_database import get_database_paths, load_database
+from eaBPCalculator_pathFilter import compile_blacklist, walk_files
+from eaBPCalculator_rowWriter import OUTPUT_FORMATS, check_output_format, get_output_path, open_row_writer
+from eaBPCalculator_profiling import profiler, add_profile_arguments, start_profiling, finish_profiling
 
 # The following variables are for inserting your game folder path and mod folder path for parsing data.
 # Keep in mind that order of list matters. If you wish to add more folders to the list, use any
@@ -18,90 +24,232 @@ your_contentBlacklist_folder = {
     "blacklistFolder1": "[Insert your bp.sbc folder path here]"
     # ,"blacklistFolder2": "[Insert your bp.sbc folder path here]"
     }
+# Read bp.sbc files as a stream, so large blueprints do not have to fit in memory. Set to False to load them whole.
+your_streamingBlueprint_parsing = True
 
 def parse_input_files(input_dirs, blacklist_dirs):
+    blacklist = compile_blacklist(blacklist_dirs)
     input_files = []
     for input_dir in input_dirs.values():
-        for root, dirs, files in os.walk(input_dir):
-            if any(bl in root for bl in blacklist_dirs.values()):
-                continue
-            for file in files:
-                if file.endswith('.sbc'):
-                    input_files.append(os.path.join(root, file))
+        input_files.extend(walk_files(input_dir, blacklist, '.sbc'))
     return input_files
 
 def parse_database_file():
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    db_file_path = os.path.join(script_dir, 'parsedData.xml')
+    db_file_path, cache_file_path = get_database_paths(script_dir)
     if not os.path.exists(db_file_path):
         print("Database file 'parsedData.xml' not found. Stopping execution.")
         exit(1)
-    return ET.parse(db_file_path).getroot()
+    return load_database(db_file_path, cache_file_path)
+
+# Precompute the Block lookup once: SubtypeId and (SubtypeId, CubeSize) both map to pre-summed Component counts
+def build_block_index(cube_blocks):
+    block_index = {}
+    for definition in cube_blocks:
+        subtype_id = definition.SubtypeId
+        for key in (subtype_id, (subtype_id, definition.CubeSize)):
+            component_counts = block_index.setdefault(key, {})
+            for subtype, count in definition.Components:
+                component_counts[subtype] = component_counts.get(subtype, 0) + count
+    return block_index
 
-def parse_component_counts(input_file, database_root, counts):
+# Prefer the Block variant matching the grid size, then fall back to any Block with the same SubtypeId
+def find_block_components(block_index, subtype_name, grid_size):
+    component_counts = block_index.get((subtype_name, grid_size))
+    if component_counts is None:
+        component_counts = block_index.get(subtype_name)
+    return component_counts
+
+# Count Blocks by SubtypeName for every CubeGrid of the blueprint: [(DisplayName, GridSizeEnum, {SubtypeName: count})]
+def read_grid_blocks(input_file):
     tree = ET.parse(input_file)
     root = tree.getroot()
+    grids = []
     for cube_grid in root.findall('.//CubeGrid'):
-        display_name = cube_grid.find('DisplayName').text
+        block_counts = {}
         for block in cube_grid.findall('.//MyObjectBuilder_CubeBlock'):
-            subtype_name = block.find('SubtypeName').text
+            subtype_name = block.findtext('SubtypeName')
             if subtype_name:
-                match_found = False
-                for definition in database_root.findall('.//Definition'):
-                    subtype_id = definition.find('SubtypeId').text
-                    if subtype_id == subtype_name:
-                        match_found = True
-                        for component in definition.findall('.//Component'):
-                            subtype = component.get('Subtype')
-                            count = int(component.get('Count'))
-                            if display_name not in counts:
-                                counts[display_name] = {}
-                            if subtype not in counts[display_name]:
-                                counts[display_name][subtype] = 0
-                            counts[display_name][subtype] += count
-                if not match_found:
-                    print(f"No match found for block: {subtype_name}")
+                block_counts[subtype_name] = block_counts.get(subtype_name, 0) + 1
+        grids.append((cube_grid.find('DisplayName').text, cube_grid.findtext('GridSizeEnum'), block_counts))
+    return grids
+
+# Same as read_grid_blocks, but counts Blocks while the file is read and drops every element once it is closed,
+# so memory stays flat for any blueprint size. A Block is counted when its SubtypeName closes, which keeps the
+# document order of findall even for Blocks nested inside other Blocks (projectors with ProjectedGrids).
+def stream_grid_blocks(input_file):
+    grids = []
+    open_grids = []
+    open_elements = []
+    counted_blocks = set()
+    for event, element in ET.iterparse(input_file, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'CubeGrid':
+                grid = [element, None, None, {}]
+                grids.append(grid)
+                open_grids.append(grid)
+            open_elements.append(element)
+            continue
+
+        open_elements.pop()
+        parent = open_elements[-1] if open_elements else None
+        if element.tag == 'SubtypeName' and parent is not None and parent.tag == 'MyObjectBuilder_CubeBlock':
+            # Only the first SubtypeName of a Block counts, like findtext
+            if id(parent) not in counted_blocks:
+                counted_blocks.add(id(parent))
+                if element.text:
+                    for grid in open_grids:
+                        block_counts = grid[3]
+                        block_counts[element.text] = block_counts.get(element.text, 0) + 1
+        elif element.tag == 'MyObjectBuilder_CubeBlock':
+            counted_blocks.discard(id(element))
+        elif element.tag == 'CubeGrid':
+            open_grids.pop()
+        elif open_grids and parent is open_grids[-1][0]:
+            if element.tag == 'DisplayName' and open_grids[-1][1] is None:
+                open_grids[-1][1] = element.text
+            elif element.tag == 'GridSizeEnum' and open_grids[-1][2] is None:
+                open_grids[-1][2] = element.text
+
+        if parent is not None:
+            parent.remove(element)
+
+    return [(display_name, grid_size, block_counts) for _, display_name, grid_size, block_counts in grids]
+
+# Component counts of one grid, from its Block histogram. Grids with the same size and histogram (copies of
+# turrets, drones, modules) share one result through grid_cache, keyed by that fingerprint. The matched and
+# unmatched Block numbers are cached with it, so the profile counters cover every grid, cached or not.
+def get_grid_components(block_index, grid_size, block_counts, grid_cache):
+    fingerprint = (grid_size, tuple(sorted(block_counts.items())))
+    cached = grid_cache.get(fingerprint)
+    if cached is not None:
+        grid_components, blocks_matched, blocks_unmatched = cached
+        profiler.count('grid_cache_hits')
+        profiler.count('blocks_matched', blocks_matched)
+        profiler.count('blocks_unmatched', blocks_unmatched)
+        return grid_components
+
+    profiler.count('grid_cache_misses')
+    grid_components = {}
+    blocks_matched = 0
+    blocks_unmatched = 0
+    for subtype_name, block_count in block_counts.items():
+        component_counts = find_block_components(block_index, subtype_name, grid_size)
+        if component_counts is None:
+            print(f"No match found for block: {subtype_name}")
+            blocks_unmatched += block_count
+            continue
+        blocks_matched += block_count
+        for subtype, count in component_counts.items():
+            grid_components[subtype] = grid_components.get(subtype, 0) + count * block_count
+    profiler.count('blocks_matched', blocks_matched)
+    profiler.count('blocks_unmatched', blocks_unmatched)
+    profiler.count('block_lookups', len(block_counts))
+    grid_cache[fingerprint] = (grid_components, blocks_matched, blocks_unmatched)
+    return grid_components
+
+# on_grid, if given, is called with every grid's Components as soon as that grid is done
+def parse_component_counts(input_file, block_index, counts, streaming=True, grid_cache=None, on_grid=None):
+    if grid_cache is None:
+        grid_cache = {}
+    with profiler.stage('read_blueprint'):
+        grids = stream_grid_blocks(input_file) if streaming else read_grid_blocks(input_file)
+    profiler.count('blueprint_files')
+    profiler.count('grids', len(grids))
+
+    with profiler.stage('match_blocks'):
+        for display_name, grid_size, block_counts in grids:
+            grid_components = get_grid_components(block_index, grid_size, block_counts, grid_cache)
+            if not grid_components:
+                continue
+            if on_grid is not None:
+                on_grid(display_name, grid_components)
+            if display_name not in counts:
+                counts[display_name] = {}
+            grid_counts = counts[display_name]
+            for subtype, count in grid_components.items():
+                grid_counts[subtype] = grid_counts.get(subtype, 0) + count
     return counts
 
-def write_output_file(counts, script_dir):
-    root = ET.Element('Definitions')
-    total_counts = {}
-
-    for display_name, components in counts.items():
-        display_elem = ET.SubElement(root, 'DisplayName')
-        display_elem.set('Name', display_name)
-        for subtype, count in components.items():
-            component = ET.SubElement(display_elem, 'Component')
-            component.set('Subtype', subtype)
-            component.set('Count', str(count))
-            if subtype not in total_counts:
-                total_counts[subtype] = 0
-            total_counts[subtype] += count
-
-    total_elem = ET.SubElement(root, 'Total')
-    for subtype, count in total_counts.items():
-        component = ET.SubElement(total_elem, 'Component')
-        component.set('Subtype', subtype)
-        component.set('Count', str(count))
-
-    tree = ET.ElementTree(root)
-    output_path = os.path.join(script_dir, 'exportComponents.xml')
-
-    # Pretty printing
-    xmlstr = xml.dom.minidom.parseString(ET.tostring(root)).toprettyxml(indent="   ")
-    with open(output_path, "w") as f:
-        f.write(xmlstr)
+# total_counts can be passed in when the caller already keeps the Total up to date
+def write_output_file(counts, output_path, total_counts=None):
+    add_to_total = total_counts is None
+    if add_to_total:
+        total_counts = {}
+
+    with atomic_write(output_path, "w", encoding='utf-8') as f:
+        writer = IndentedXmlWriter(f, indent="   ")
+        writer.start('Definitions')
+
+        for display_name, components in counts.items():
+            writer.start('DisplayName', {'Name': display_name})
+            for subtype, count in components.items():
+                writer.element('Component', {'Subtype': subtype, 'Count': str(count)})
+                if not add_to_total:
+                    continue
+                if subtype not in total_counts:
+                    total_counts[subtype] = 0
+                total_counts[subtype] += count
+            writer.end()
+
+        writer.start('Total')
+        for subtype, count in total_counts.items():
+            writer.element('Component', {'Subtype': subtype, 'Count': str(count)})
+        writer.end()
+
+        writer.end()
+
+    print(f"Extracted data written to {output_path}")
+
+# Same counts as flat rows, written grid by grid while the blueprints are read. A grid name can show up in more than
+# one group of rows, when several grids share it; add them up like the XML output does. The Total rows come last.
+def export_component_rows(input_files, block_index, output_path, output_format, streaming=True, grid_cache=None):
+    counts = {}
+    with open_row_writer(output_path, output_format) as row_writer:
+        def write_grid(display_name, grid_components):
+            row_writer.write_grid(display_name, ((subtype, 'Component', count) for subtype, count in grid_components.items()))
+
+        for input_file in input_files:
+            counts = parse_component_counts(input_file, block_index, counts, streaming, grid_cache, write_grid)
+
+        total_counts = {}
+        for components in counts.values():
+            for subtype, count in components.items():
+                total_counts[subtype] = total_counts.get(subtype, 0) + count
+        row_writer.write_grid(None, ((subtype, 'Component', count) for subtype, count in total_counts.items()))
 
     print(f"Extracted data written to {output_path}")
+    return counts
 
 def main():
+    argument_parser = argparse.ArgumentParser(description="Export the components of your blueprints using the Database file.")
+    argument_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='xml',
+                                 help="write nested XML, or flat rows as csv, jsonl or parquet (parquet needs pyarrow)")
+    add_profile_arguments(argument_parser)
+    args = argument_parser.parse_args()
+    check_output_format(args.format)
+    report_file = start_profiling(args, __file__)
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    input_files = parse_input_files(your_gameBlueprint_folder, your_contentBlacklist_folder)
-    database_root = parse_database_file()
+    with profiler.stage('parse_input_files'):
+        input_files = parse_input_files(your_gameBlueprint_folder, your_contentBlacklist_folder)
+    with profiler.stage('load_database'):
+        _, _, cube_blocks = parse_database_file()
+    with profiler.stage('build_block_index'):
+        block_index = build_block_index(cube_blocks)
+    grid_cache = {}
+    if args.format != 'xml':
+        export_component_rows(input_files, block_index, get_output_path(script_dir, 'exportComponents', args.format),
+                              args.format, your_streamingBlueprint_parsing, grid_cache)
+        finish_profiling(report_file, __file__)
+        return
+
     counts = {}
     for input_file in input_files:
-        counts = parse_component_counts(input_file, database_root, counts)
-    write_output_file(counts, script_dir)
+        counts = parse_component_counts(input_file, block_index, counts, your_streamingBlueprint_parsing, grid_cache)
+    with profiler.stage('write_xml'):
+        write_output_file(counts, os.path.join(script_dir, 'exportComponents.xml'))
+    finish_profiling(report_file, __file__)
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,11 @@
 import os
+import argparse
 import xml.etree.ElementTree as ET
-import xml.dom.minidom
+from eaBPCalculator_xmlWriter import IndentedXmlWriter
+from eaBPCalculator_atomicFile import atomic_write
+from eaBPCalculator_database import get_database_paths, load_database
+from eaBPCalculator_rowWriter import OUTPUT_FORMATS, check_output_format, get_output_path, open_row_writer, read_rows
+from eaBPCalculator_profiling import profiler, add_profile_arguments, start_profiling, finish_profiling
 
 # Check file paths
 def load_xml(file_path):
@@ -9,71 +14,164 @@ def load_xml(file_path):
         exit(1)
     return ET.parse(file_path).getroot()
 
+# Check the Database path and load it from the cache if it is up to date
+def load_database_file(db_file_path, cache_file_path):
+    if not os.path.exists(db_file_path):
+        print(f"File {db_file_path} not found!")
+        exit(1)
+    return load_database(db_file_path, cache_file_path)
+
 def get_script_directory():
     return os.path.dirname(os.path.abspath(__file__))
 
-# Introduce Component data and filter out duplicates
-def get_component_info(db_root, subtype_id):
-    for component in db_root.find('Components').findall('Component'):
-        if component.find('SubtypeId').text == subtype_id:
-            display_name = component.find('DisplayName').text
-            blueprints = []
-            for bp in db_root.find('Blueprints').findall('Blueprint'):
-                if bp.find('DisplayName').text == display_name:
-                    blueprints.append(bp)
-            if len(blueprints) > 1:
-                print(f"Duplicate Blueprint entry found, processing the last: {display_name}, total of {len(blueprints)}")
-            return display_name, blueprints[-1] if blueprints else None
-    return None, None
-
-# Convert Component name into Blueprint name
-def find_prerequisite_info(db_root, subtype_id):
-    for component in db_root.find('Components').findall('Component'):
-        if component.find('SubtypeId').text == subtype_id:
-            return component.find('DisplayName').text
-    return None
+# Index Component data once and filter out duplicates: SubtypeId -> (DisplayName, Blueprint recipe)
+def build_recipe_index(components, blueprints_list):
+    display_names = {}
+    for component in components:
+        if component.SubtypeId not in display_names:
+            display_names[component.SubtypeId] = component.DisplayName
+
+    blueprints = {}
+    for bp in blueprints_list:
+        blueprints.setdefault(bp.DisplayName, []).append(bp)
+
+    recipe_index = {}
+    for subtype_id, display_name in display_names.items():
+        matches = blueprints.get(display_name, [])
+        if len(matches) > 1:
+            print(f"Duplicate Blueprint entry found, processing the last: {display_name}, total of {len(matches)}")
+        recipe_index[subtype_id] = (display_name, parse_recipe(matches[-1]) if matches else None)
+    return recipe_index
+
+# Keep only what the calculation needs from a Blueprint: its Result amount and Prerequisites
+def parse_recipe(blueprint):
+    prerequisites = tuple((item.SubtypeId, item.TypeId, item.Amount) for item in blueprint.Prerequisites)
+    return {'ResultAmount': get_result_amount(blueprint), 'Prerequisites': prerequisites}
+
+# Convert Component name into Blueprint name and recipe
+def get_component_info(recipe_index, subtype_id):
+    profiler.count('recipe_lookups')
+    return recipe_index.get(subtype_id, (None, None))
 
 # Check and store valid Result/s field of Blueprint
 def get_result_amount(blueprint):
-    result_element = blueprint.find('Result')
-    if result_element is not None and 'Amount' in result_element.attrib:
-        return float(result_element.attrib['Amount'])
+    if blueprint.Result is not None and blueprint.Result.Amount is not None:
+        return float(blueprint.Result.Amount)
     
-    results_element = blueprint.find('Results')
-    if results_element is not None:
-        result_elements = results_element.findall('Item')
-        if result_elements and 'Amount' in result_elements[0].attrib:
-            return float(result_elements[0].attrib['Amount'])
+    if blueprint.Results:
+        return float(blueprint.Results[0].Amount)
     
     return None
 
-# All the math to divide the Component count by Result amount and multiply the result by Item Component counts
-def calculate_totals(input_root, db_root):
+# Read the Component counts of every DisplayName from "exportComponents.xml": {DisplayName: {Subtype: Count}}
+def read_component_counts(input_root):
+    counts = {}
+    for display_name in input_root.findall('DisplayName'):
+        components = counts.setdefault(display_name.attrib['Name'], {})
+        for component in display_name.findall('Component'):
+            subtype = component.attrib['Subtype']
+            components[subtype] = components.get(subtype, 0) + int(component.attrib['Count'])
+    return counts
+
+# Same counts from the rows of "exportComponents.csv", ".jsonl" or ".parquet". Total rows are left out.
+def read_component_rows(input_path):
+    counts = {}
+    for grid, subtype, _, amount in read_rows(input_path):
+        if grid is None:
+            continue
+        components = counts.setdefault(grid, {})
+        components[subtype] = components.get(subtype, 0) + int(amount)
+    return counts
+
+# Cache of flattened recipes shared between grids: Component SubtypeId -> raw materials per unit
+def new_expansion_cache():
+    return {'Materials': {}, 'Acyclic': {}, 'Cycles': set()}
+
+# Check if a Prerequisite item is itself a Component which can be crafted further
+def get_expandable_recipe(recipe_index, subtype_id):
+    display_name, recipe = get_component_info(recipe_index, subtype_id)
+    if not recipe:
+        return None
+    if recipe['ResultAmount'] is None:
+        print(f"No Result amount found for Blueprint prerequisite: {display_name}")
+        return None
+    return recipe
+
+# Flatten a Component recipe into raw materials per unit, to any depth. Recipe cycles (scrap, recycling)
+# are reported and the repeated item is kept as a material instead of being expanded again.
+def expand_recipe(recipe_index, subtype_id, expansion_cache):
+    expanded = expansion_cache['Materials']
+    if subtype_id in expanded:
+        profiler.count('expansion_cache_hits')
+    else:
+        profiler.count('expansion_cache_misses')
+        expanded[subtype_id] = expand_recipe_path(recipe_index, subtype_id, expansion_cache, ())[0]
+    return expanded[subtype_id]
+
+def expand_recipe_path(recipe_index, subtype_id, expansion_cache, path):
+    acyclic = expansion_cache['Acyclic']
+    if subtype_id in acyclic:
+        return acyclic[subtype_id], set()
+
+    path = path + (subtype_id,)
+    recipe = get_component_info(recipe_index, subtype_id)[1]
+    materials = {}
+    cycle_heads = set()
+    for item_subtype, item_type, item_amount in recipe['Prerequisites']:
+        amount_per_unit = item_amount / recipe['ResultAmount']
+        item_recipe = get_expandable_recipe(recipe_index, item_subtype)
+        if item_recipe and item_subtype in path:
+            cycle = path[path.index(item_subtype):] + (item_subtype,)
+            if frozenset(cycle) not in expansion_cache['Cycles']:
+                expansion_cache['Cycles'].add(frozenset(cycle))
+                print(f"Recipe cycle found, keeping {item_subtype} as material: {' -> '.join(cycle)}")
+                profiler.count('recipe_cycles')
+            cycle_heads.add(item_subtype)
+            item_recipe = None
+
+        if not item_recipe:
+            item_materials = {item_subtype: (item_type, 1.0)}
+        else:
+            item_materials, item_cycle_heads = expand_recipe_path(recipe_index, item_subtype, expansion_cache, path)
+            cycle_heads |= item_cycle_heads
+
+        for material_subtype, (material_type, material_amount) in item_materials.items():
+            if material_subtype in materials:
+                material_type, previous_amount = materials[material_subtype]
+                materials[material_subtype] = (material_type, previous_amount + amount_per_unit * material_amount)
+            else:
+                materials[material_subtype] = (material_type, amount_per_unit * material_amount)
+
+    # Only results which did not cut a cycle are independent of the path taken and can be reused inside other recipes
+    if not cycle_heads:
+        acyclic[subtype_id] = materials
+    return materials, cycle_heads
+
+# All the math: multiply the Component count by its flattened raw materials per unit
+# on_grid, if given, is called with every grid's materials as soon as that grid is done
+def calculate_totals(counts, recipe_index, expansion_cache=None, on_grid=None):
+    if expansion_cache is None:
+        expansion_cache = new_expansion_cache()
     categorized_totals = {}
     total = {}
-    for display_name in input_root.findall('DisplayName'):
-        name = display_name.attrib['Name']
-        components = display_name.findall('Component')
+    for name, components in counts.items():
         display_totals = {}
-        for component in components:
-            subtype = component.attrib['Subtype']
-            count = int(component.attrib['Count'])
-            display_name, blueprint = get_component_info(db_root, subtype)
-            if not blueprint:
+        for subtype, count in components.items():
+            display_name, recipe = get_component_info(recipe_index, subtype)
+            if not recipe:
                 print(f"No matching Blueprint for Component: {display_name}")
+                profiler.count('components_without_blueprint')
                 continue
             
-            result_amount = get_result_amount(blueprint)
-            if result_amount is None:
+            if recipe['ResultAmount'] is None:
                 print(f"No result amount found for Blueprint: {display_name}")
+                profiler.count('components_without_blueprint')
                 continue
 
-            for item in blueprint.find('Prerequisites').findall('Item'):
-                item_amount = float(item.attrib['Amount'])
-                item_type = item.attrib['TypeId']
-                item_subtype = item.attrib['SubtypeId']
-                total_amount = (count / result_amount) * item_amount
-                
+            materials = expand_recipe(recipe_index, subtype, expansion_cache)
+            for item_subtype, (item_type, item_amount) in materials.items():
+                total_amount = count * item_amount
+
                 if item_subtype not in display_totals:
                     display_totals[item_subtype] = {'TypeId': item_type, 'Amount': 0}
                 display_totals[item_subtype]['Amount'] += total_amount
@@ -82,80 +180,85 @@ def calculate_totals(input_root, db_root):
                     total[item_subtype] = {'TypeId': item_type, 'Amount': 0}
                 total[item_subtype]['Amount'] += total_amount
 
-                # Check for prerequisite components and process matches
-                prerequisite_display_name = find_prerequisite_info(db_root, item_subtype)
-                if prerequisite_display_name:
-                    blueprint_display_name, prerequisite_blueprint = get_component_info(db_root, item_subtype)
-                    if prerequisite_blueprint:
-                        prerequisite_result_amount = get_result_amount(prerequisite_blueprint)
-                        if prerequisite_result_amount is None:
-                            print(f"No Result amount found for Blueprint prerequisite: {prerequisite_display_name}")
-                            continue
-
-                        for prerequisite_item in prerequisite_blueprint.find('Prerequisites').findall('Item'):
-                            prerequisite_item_amount = float(prerequisite_item.attrib['Amount'])
-                            prerequisite_item_type = prerequisite_item.attrib['TypeId']
-                            prerequisite_item_subtype = prerequisite_item.attrib['SubtypeId']
-                            prerequisite_total_amount = (total_amount / prerequisite_result_amount) * prerequisite_item_amount
-                            
-                            if prerequisite_item_subtype not in display_totals:
-                                display_totals[prerequisite_item_subtype] = {'TypeId': prerequisite_item_type, 'Amount': 0}
-                            display_totals[prerequisite_item_subtype]['Amount'] += prerequisite_total_amount
-
-                            if prerequisite_item_subtype not in total:
-                                total[prerequisite_item_subtype] = {'TypeId': prerequisite_item_type, 'Amount': 0}
-                            total[prerequisite_item_subtype]['Amount'] += prerequisite_total_amount
-
-                        # Remove the excessive output entries if SubtypeID in Item was found in Components DispayName
-                        if item_subtype in display_totals:
-                            del display_totals[item_subtype]
-                        if item_subtype in total:
-                            del total[item_subtype]
-                            print(f"Removed match-in-match item from list: {item_subtype}")
-
         categorized_totals[name] = display_totals
+        if on_grid is not None:
+            on_grid(name, display_totals)
     return categorized_totals, total
 
 # Writing and composing the output file
 def write_output(categorized_totals, total, output_path):
-    root = ET.Element('Definitions')
-    
-    # Add categories by DisplayName
-    for display_name, totals in categorized_totals.items():
-        display_elem = ET.SubElement(root, 'DisplayName', {'Name': display_name})
-        for subtype, info in totals.items():
-            ET.SubElement(display_elem, 'Component', {
+    with atomic_write(output_path, 'w', encoding='utf-8') as f:
+        writer = IndentedXmlWriter(f, indent="    ")
+        writer.start('Definitions')
+
+        # Add categories by DisplayName
+        for display_name, totals in categorized_totals.items():
+            writer.start('DisplayName', {'Name': display_name})
+            for subtype, info in totals.items():
+                writer.element('Component', {
+                    'Subtype': subtype,
+                    'TypeId': info['TypeId'],
+                    'Count': str(info['Amount'])
+                })
+            writer.end()
+
+        # Add the final Total category
+        writer.start('Total')
+        for subtype, info in total.items():
+            writer.element('Component', {
                 'Subtype': subtype,
                 'TypeId': info['TypeId'],
                 'Count': str(info['Amount'])
             })
+        writer.end()
 
-    # Add the final Total category
-    total_elem = ET.SubElement(root, 'Total')
-    for subtype, info in total.items():
-        ET.SubElement(total_elem, 'Component', {
-            'Subtype': subtype,
-            'TypeId': info['TypeId'],
-            'Count': str(info['Amount'])
-        })
+        writer.end()
 
-    # Convert to string with pretty printing
-    xml_str = ET.tostring(root, encoding='utf-8')
-    pretty_xml_str = xml.dom.minidom.parseString(xml_str).toprettyxml(indent="    ")
+# Same materials as flat rows, each grid written as soon as its materials are calculated. The Total rows come last.
+def export_material_rows(counts, recipe_index, output_path, output_format):
+    with open_row_writer(output_path, output_format) as row_writer:
+        def write_grid(display_name, display_totals):
+            row_writer.write_grid(display_name, ((subtype, info['TypeId'], info['Amount']) for subtype, info in display_totals.items()))
 
-    # Write to the output file
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(pretty_xml_str)
+        _, total = calculate_totals(counts, recipe_index, on_grid=write_grid)
+        row_writer.write_grid(None, ((subtype, info['TypeId'], info['Amount']) for subtype, info in total.items()))
 
 # Run the code
 if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Export the materials for \"exportComponents.xml\" using the Database file.")
+    argument_parser.add_argument('--input', help="Components to read: exportComponents.xml, or the rows written by "
+                                                 "eaBPCalculator_exportBPComps.py --format (.csv, .jsonl or .parquet)")
+    argument_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='xml',
+                                 help="write nested XML, or flat rows as csv, jsonl or parquet (parquet needs pyarrow)")
+    add_profile_arguments(argument_parser)
+    args = argument_parser.parse_args()
+    check_output_format(args.format)
+    report_file = start_profiling(args, __file__)
+
     script_dir = get_script_directory()
-    db_file = os.path.join(script_dir, "parsedData.xml")
-    input_file = os.path.join(script_dir, "exportComponents.xml")
-    output_file = os.path.join(script_dir, "exportMaterials.xml")
+    db_file, cache_file = get_database_paths(script_dir)
+    input_file = args.input or os.path.join(script_dir, "exportComponents.xml")
+    output_file = get_output_path(script_dir, "exportMaterials", args.format)
 
-    db_root = load_xml(db_file)
-    input_root = load_xml(input_file)
+    with profiler.stage('load_database'):
+        components, blueprints, _ = load_database_file(db_file, cache_file)
+    with profiler.stage('read_components'):
+        if input_file.lower().endswith('.xml'):
+            counts = read_component_counts(load_xml(input_file))
+        elif os.path.exists(input_file):
+            counts = read_component_rows(input_file)
+        else:
+            print(f"File {input_file} not found!")
+            exit(1)
 
-    categorized_totals, total = calculate_totals(input_root, db_root)
-    write_output(categorized_totals, total, output_file)
+    with profiler.stage('build_recipe_index'):
+        recipe_index = build_recipe_index(components, blueprints)
+    if args.format != 'xml':
+        with profiler.stage('calculate_totals'):
+            export_material_rows(counts, recipe_index, output_file, args.format)
+    else:
+        with profiler.stage('calculate_totals'):
+            categorized_totals, total = calculate_totals(counts, recipe_index)
+        with profiler.stage('write_xml'):
+            write_output(categorized_totals, total, output_file)
+    finish_profiling(report_file, __file__)
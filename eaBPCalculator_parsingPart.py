@@ -1,6 +1,16 @@
 import os
+import hashlib
+import pickle
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import xml.etree.ElementTree as ET
-import xml.dom.minidom
+from eaBPCalculator_xmlWriter import IndentedXmlWriter
+from eaBPCalculator_atomicFile import atomic_write
+from eaBPCalculator_database import get_database_paths, get_source_signature, write_database_cache, intern_text
+from eaBPCalculator_database import ComponentRecord, ItemRecord, ResultRecord, BlueprintRecord, BlockComponentRecord, CubeBlockRecord
+from eaBPCalculator_pathFilter import compile_blacklist, walk_files
+from eaBPCalculator_profiling import profiler, add_profile_arguments, start_profiling, finish_profiling
 
 # The following variables are for inserting your game folder path and mod folder path for parsing data.
 # Keep in mind that order of list matters. If you wish to add more folders to the list, use any
@@ -19,83 +29,250 @@ your_contentBlacklist_folder = {
     "blacklistFolder1": "[Insert your mod folder path here]"
     # ,"blacklistFolder2": "[Insert your blacklist folder here]"
     }
+# Number of processes used to parse .sbc files. Keep 1 to parse in this process only, or set None to use every CPU core.
+your_parsingWorkers_count = 1
+# Reuse the records of .sbc files which did not change since the last run. They are kept in "parsedData.manifest".
+# Enable hashing to compare file contents instead of modification time and size.
+your_incrementalRebuild_enabled = True
+your_manifestHashing_enabled = False
+
+MANIFEST_VERSION = 2
+
+# Collect every .sbc file in folder order, so files from later folders are merged last and win
+def find_sbc_files(folder_dict, blacklist_dict):
+    blacklist = compile_blacklist(blacklist_dict)
+    file_paths = []
+    for folder_path in folder_dict.values():
+        file_paths.extend(walk_files(folder_path, blacklist, '.sbc'))
+    return file_paths
+
+# Search a single .sbc file for direct match of Elements and SubElements, in one walk over the whole tree.
+# Only (key, record) pairs are returned, so this can run in a worker process.
+def extract_sbc_records(file_path):
+    components = []
+    blueprints = []
+    cube_blocks = []
+    try:
+        with profiler.stage('xml_parse'):
+            tree = ET.parse(file_path)
+        root = tree.getroot()
+    except ET.ParseError as e:
+        return components, blueprints, cube_blocks, str(e)
+
+    for element in root.iter():
+        if element is root:
+            continue
+        tag = element.tag
+        if tag == 'Component':
+            record = read_component(element)
+            if record is not None:
+                components.append(((record.SubtypeId, record.DisplayName), record))
+        elif tag == 'Blueprint':
+            record = read_blueprint(element)
+            if record is not None:
+                blueprints.append(((record.SubtypeId, record.DisplayName), record))
+        elif tag == 'CubeBlocks':
+            for definition in element:
+                if definition.tag != 'Definition':
+                    continue
+                record = read_cube_block(definition)
+                if record is not None:
+                    cube_blocks.append(((record.SubtypeId, record.DisplayName, record.CubeSize), record))
+
+    return components, blueprints, cube_blocks, None
+
+# The readers below look at the direct children only, each of them once. Like "./Id/SubtypeId" and "./DisplayName",
+# the first match wins, and a missing SubtypeId or DisplayName skips the definition.
+def read_component(component):
+    subtype_id = display_name = None
+    for child in component:
+        if child.tag == 'Id':
+            if subtype_id is None:
+                subtype_id = child.find('SubtypeId')
+        elif child.tag == 'DisplayName':
+            if display_name is None:
+                display_name = child
+
+    if subtype_id is None or display_name is None:
+        return None
+    return ComponentRecord(intern_text(subtype_id.text), intern_text(display_name.text))
+
+def read_blueprint(blueprint):
+    subtype_id = display_name = result = None
+    prerequisites = []
+    results = []
+    for child in blueprint:
+        tag = child.tag
+        if tag == 'Id':
+            if subtype_id is None:
+                subtype_id = child.find('SubtypeId')
+        elif tag == 'DisplayName':
+            if display_name is None:
+                display_name = child
+        elif tag == 'Prerequisites':
+            prerequisites.extend(item for item in child if item.tag == 'Item')
+        elif tag == 'Results':
+            results.extend(item for item in child if item.tag == 'Item')
+        elif tag == 'Result':
+            if result is None:
+                result = child
+
+    if subtype_id is None or display_name is None:
+        return None
+    return BlueprintRecord(
+        intern_text(subtype_id.text),
+        intern_text(display_name.text),
+        sum_items(prerequisites),
+        sum_items(results),
+        ResultRecord(
+            result.get('Amount'),
+            intern_text(result.get('TypeId')),
+            intern_text(result.get('SubtypeId'))
+        ) if result is not None else None
+    )
+
+def read_cube_block(cube_block):
+    subtype_id = display_name = cube_size = None
+    components = []
+    for child in cube_block:
+        tag = child.tag
+        if tag == 'Id':
+            if subtype_id is None:
+                subtype_id = child.find('SubtypeId')
+        elif tag == 'DisplayName':
+            if display_name is None:
+                display_name = child
+        elif tag == 'CubeSize':
+            if cube_size is None:
+                cube_size = child
+        elif tag == 'Components':
+            components.extend(component for component in child if component.tag == 'Component')
+
+    if subtype_id is None or display_name is None or cube_size is None:
+        return None
+    return CubeBlockRecord(
+        intern_text(subtype_id.text),
+        intern_text(display_name.text),
+        intern_text(cube_size.text),
+        sum_components(components)
+    )
+
+# Runs in a worker process. While profiling, the stage timings and counters of the worker are sent back with the
+# records, so they show up in the report of the main process.
+def extract_sbc_records_in_worker(file_path, profiled=False):
+    if not profiled:
+        return extract_sbc_records(file_path), None
+    profiler.enabled = True
+    profiler.stages = {}
+    profiler.counters = {}
+    records = extract_sbc_records(file_path)
+    return records, (profiler.stages, profiler.counters)
+
+# Extract records from every file, in a process pool when more than one worker is requested.
+# Executor.map keeps the results in the same order as file_paths.
+def extract_all_sbc_records(file_paths, workers=1):
+    profiler.count('sbc_files_parsed', len(file_paths))
+    if workers == 1 or len(file_paths) < 2:
+        with profiler.stage('extract_sbc_records'):
+            return [extract_sbc_records(file_path) for file_path in file_paths]
+
+    chunk_size = max(1, len(file_paths) // ((workers or os.cpu_count() or 1) * 4))
+    extract = partial(extract_sbc_records_in_worker, profiled=profiler.enabled)
+    with profiler.stage('extract_sbc_records_pool'), ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(extract, file_paths, chunksize=chunk_size))
+    for _, worker_profile in results:
+        if worker_profile is not None:
+            profiler.merge(*worker_profile)
+    return [records for records, _ in results]
+
+# Load the records of the previous run, keyed by file path. A missing or outdated manifest means a full rebuild.
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'rb') as manifest_file:
+            manifest = pickle.load(manifest_file)
+    except Exception:
+        # A damaged pickle can raise almost anything, which just means a full rebuild
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('Version') != MANIFEST_VERSION:
+        return {}
+    return manifest['Files']
+
+def write_manifest(manifest_path, manifest_files):
+    try:
+        with atomic_write(manifest_path, 'wb') as manifest_file:
+            pickle.dump({'Version': MANIFEST_VERSION, 'Files': manifest_files}, manifest_file, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print(f"Error writing manifest file: {e}")
+
+# Modification time and size, or the content hash when hashing is enabled
+def get_file_signature(file_path, use_hash=False):
+    if use_hash:
+        content_hash = hashlib.sha256()
+        with open(file_path, 'rb') as sbc_file:
+            for chunk in iter(lambda: sbc_file.read(1 << 20), b''):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+    file_stat = os.stat(file_path)
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+# Only reparse files which were added or changed since the manifest was written, removed files are dropped
+def extract_changed_sbc_records(file_paths, workers=1, manifest_path=None, use_hash=False):
+    with profiler.stage('load_manifest'):
+        previous_files = load_manifest(manifest_path) if manifest_path else {}
+    manifest_files = {}
+    changed_paths = []
+    with profiler.stage('check_manifest'):
+        for file_path in file_paths:
+            if file_path in manifest_files:
+                continue
+            signature = get_file_signature(file_path, use_hash)
+            previous = previous_files.get(file_path)
+            if previous is not None and previous['Signature'] == signature:
+                manifest_files[file_path] = previous
+            else:
+                manifest_files[file_path] = {'Signature': signature}
+                changed_paths.append(file_path)
+    profiler.count('sbc_files_reused', len(manifest_files) - len(changed_paths))
+
+    for file_path, records in zip(changed_paths, extract_all_sbc_records(changed_paths, workers)):
+        manifest_files[file_path]['Records'] = records
+
+    if manifest_path:
+        removed_count = len(previous_files.keys() - manifest_files.keys())
+        print(f"Reparsed {len(changed_paths)} of {len(manifest_files)} .sbc files, {removed_count} removed since last run.")
+        with profiler.stage('write_manifest'):
+            write_manifest(manifest_path, manifest_files)
+    return [manifest_files[file_path]['Records'] for file_path in file_paths]
 
 # Parsing folders and search for direct match of Elements and SubElements
-def parse_sbc_files(folder_dict, blacklist_dict):
+def parse_sbc_files(folder_dict, blacklist_dict, workers=1, manifest_path=None, use_hash=False):
     components = {}
     blueprints = {}
     cube_blocks = {}
 
-    for folder_path in folder_dict.values():
-        for root_dir, _, files in os.walk(folder_path):
-            if any(os.path.commonpath([root_dir, blacklisted]) == blacklisted for blacklisted in blacklist_dict.values()):
-                continue
-
-            for filename in files:
-                if filename.endswith('.sbc'):
-                    file_path = os.path.join(root_dir, filename)
-                    try:
-                        tree = ET.parse(file_path)
-                        root = tree.getroot()
-
-                        for component in root.findall('.//Component'):
-                            subtype_id = component.find('./Id/SubtypeId')
-                            display_name = component.find('./DisplayName')
-
-                            if subtype_id is not None and display_name is not None:
-                                key = (subtype_id.text, display_name.text)
-                                components[key] = {
-                                    'SubtypeId': subtype_id.text,
-                                    'DisplayName': display_name.text
-                                }
-
-                        for blueprint in root.findall('.//Blueprint'):
-                            subtype_id = blueprint.find('./Id/SubtypeId')
-                            display_name = blueprint.find('./DisplayName')
-                            prerequisites = blueprint.findall('./Prerequisites/Item')
-                            results = blueprint.findall('./Results/Item')
-                            result = blueprint.find('./Result')
-
-                            if subtype_id is not None and display_name is not None:
-                                key = (subtype_id.text, display_name.text)
-                                blueprint_data = {
-                                    'SubtypeId': subtype_id.text,
-                                    'DisplayName': display_name.text,
-                                    'Prerequisites': sum_items(prerequisites),
-                                    'Results': sum_items(results),
-                                    'Result': {
-                                        'Amount': result.get('Amount'),
-                                        'TypeId': result.get('TypeId'),
-                                        'SubtypeId': result.get('SubtypeId')
-                                    } if result is not None else {}
-                                }
-                                blueprints[key] = blueprint_data
-
-                        for cube_block in root.findall('.//CubeBlocks/Definition'):
-                            subtype_id = cube_block.find('./Id/SubtypeId')
-                            display_name = cube_block.find('./DisplayName')
-                            cube_size = cube_block.find('./CubeSize')
-                            components_elements = cube_block.findall('./Components/Component')
-
-                            if subtype_id is not None and display_name is not None and cube_size is not None:
-                                key = (subtype_id.text, display_name.text, cube_size.text)
-                                cube_block_data = {
-                                    'SubtypeId': subtype_id.text,
-                                    'DisplayName': display_name.text,
-                                    'CubeSize': cube_size.text,
-                                    'Components': sum_components(components_elements)
-                                }
-                                cube_blocks[key] = cube_block_data
-
-                    except ET.ParseError as e:
-                        print(f"Error parsing file {filename}: {e}")
+    with profiler.stage('find_sbc_files'):
+        file_paths = find_sbc_files(folder_dict, blacklist_dict)
+    profiler.count('sbc_files_found', len(file_paths))
+    extracted_files = extract_changed_sbc_records(file_paths, workers, manifest_path, use_hash)
+    with profiler.stage('merge_records'):
+        for file_path, (file_components, file_blueprints, file_cube_blocks, error) in zip(file_paths, extracted_files):
+            if error is not None:
+                print(f"Error parsing file {os.path.basename(file_path)}: {error}")
+                profiler.count('sbc_parse_errors')
+            components.update(file_components)
+            blueprints.update(file_blueprints)
+            cube_blocks.update(file_cube_blocks)
+    profiler.count('components', len(components))
+    profiler.count('blueprints', len(blueprints))
+    profiler.count('cube_blocks', len(cube_blocks))
 
     print(f"Found {len(components)} unique components.")
     print(f"Found {len(blueprints)} unique blueprints.")
     print(f"Found {len(cube_blocks)} unique cube blocks.")
     return list(components.values()), list(blueprints.values()), list(cube_blocks.values())
 
-# Combining the matching Prerequisites for Blueprints and matching Components for Blocks
+# Combining the matching Prerequisites for Blueprints and matching Components for Blocks.
+# The TypeId of an item is the one of its first entry.
 def sum_items(items):
     item_dict = {}
 
@@ -104,11 +281,11 @@ def sum_items(items):
         amount = float(item.get('Amount', 0))
 
         if subtype_id in item_dict:
-            item_dict[subtype_id] += amount
+            item_dict[subtype_id][0] += amount
         else:
-            item_dict[subtype_id] = amount
+            item_dict[subtype_id] = [amount, item.get('TypeId')]
 
-    return [{'SubtypeId': k, 'Amount': v, 'TypeId': next(item.get('TypeId') for item in items if item.get('SubtypeId') == k)} for k, v in item_dict.items()]
+    return tuple(ItemRecord(intern_text(k), amount, intern_text(type_id)) for k, (amount, type_id) in item_dict.items())
 
 def sum_components(components):
     component_dict = {}
@@ -122,65 +299,78 @@ def sum_components(components):
         else:
             component_dict[subtype_id] = count
 
-    return [{'Subtype': k, 'Count': v} for k, v in component_dict.items()]
+    return tuple(BlockComponentRecord(intern_text(k), v) for k, v in component_dict.items())
 
-# Combines and writes all the data into "debug1.xml"
+# Combines and writes all the data into "parsedData.xml". Returns False, and keeps the old file, when writing fails.
 def write_to_output_file(output_path, components, blueprints, cube_blocks):
-    root = ET.Element('Definitions')
-
-    components_element = ET.SubElement(root, 'Components')
-    for comp in components:
-        component_element = ET.SubElement(components_element, 'Component')
-        subtype_id_element = ET.SubElement(component_element, 'SubtypeId')
-        subtype_id_element.text = comp['SubtypeId']
-        display_name_element = ET.SubElement(component_element, 'DisplayName')
-        display_name_element.text = comp['DisplayName']
-
-    blueprints_element = ET.SubElement(root, 'Blueprints')
-    for bp in blueprints:
-        blueprint_element = ET.SubElement(blueprints_element, 'Blueprint')
-        subtype_id_element = ET.SubElement(blueprint_element, 'SubtypeId')
-        subtype_id_element.text = bp['SubtypeId']
-        display_name_element = ET.SubElement(blueprint_element, 'DisplayName')
-        display_name_element.text = bp['DisplayName']
-        
-        prerequisites_element = ET.SubElement(blueprint_element, 'Prerequisites')
-        for item in bp['Prerequisites']:
-            item_element = ET.SubElement(prerequisites_element, 'Item', Amount=str(item['Amount']), TypeId=item['TypeId'], SubtypeId=item['SubtypeId'])
-
-        results_element = ET.SubElement(blueprint_element, 'Results')
-        for item in bp['Results']:
-            item_element = ET.SubElement(results_element, 'Item', Amount=str(item['Amount']), TypeId=item['TypeId'], SubtypeId=item['SubtypeId'])
-
-        if bp['Result']:
-            result_element = ET.SubElement(blueprint_element, 'Result', Amount=bp['Result']['Amount'], TypeId=bp['Result']['TypeId'], SubtypeId=bp['Result']['SubtypeId'])
-
-    cube_blocks_element = ET.SubElement(root, 'CubeBlocks')
-    for cb in cube_blocks:
-        definition_element = ET.SubElement(cube_blocks_element, 'Definition')
-        subtype_id_element = ET.SubElement(definition_element, 'SubtypeId')
-        subtype_id_element.text = cb['SubtypeId']
-        display_name_element = ET.SubElement(definition_element, 'DisplayName')
-        display_name_element.text = cb['DisplayName']
-        cube_size_element = ET.SubElement(definition_element, 'CubeSize')
-        cube_size_element.text = cb['CubeSize']
-        
-        components_element = ET.SubElement(definition_element, 'Components')
-        for component in cb['Components']:
-            component_element = ET.SubElement(components_element, 'Component', Subtype=component['Subtype'], Count=str(component['Count']))
-
     try:
-        xml_str = ET.tostring(root, encoding='utf-8', method='xml')
-        pretty_xml_str = xml.dom.minidom.parseString(xml_str).toprettyxml(indent="    ")
+        with atomic_write(output_path, 'w', encoding='utf-8') as output_file:
+            writer = IndentedXmlWriter(output_file, indent="    ")
+            writer.start('Definitions')
+
+            writer.start('Components')
+            for comp in components:
+                writer.start('Component')
+                writer.element('SubtypeId', text=comp.SubtypeId)
+                writer.element('DisplayName', text=comp.DisplayName)
+                writer.end()
+            writer.end()
+
+            writer.start('Blueprints')
+            for bp in blueprints:
+                writer.start('Blueprint')
+                writer.element('SubtypeId', text=bp.SubtypeId)
+                writer.element('DisplayName', text=bp.DisplayName)
+
+                writer.start('Prerequisites')
+                for item in bp.Prerequisites:
+                    writer.element('Item', {'Amount': str(item.Amount), 'TypeId': item.TypeId, 'SubtypeId': item.SubtypeId})
+                writer.end()
+
+                writer.start('Results')
+                for item in bp.Results:
+                    writer.element('Item', {'Amount': str(item.Amount), 'TypeId': item.TypeId, 'SubtypeId': item.SubtypeId})
+                writer.end()
 
-        with open(output_path, 'w', encoding='utf-8') as output_file:
-            output_file.write(pretty_xml_str)
+                if bp.Result is not None:
+                    writer.element('Result', {'Amount': bp.Result.Amount, 'TypeId': bp.Result.TypeId, 'SubtypeId': bp.Result.SubtypeId})
+                writer.end()
+            writer.end()
+
+            writer.start('CubeBlocks')
+            for cb in cube_blocks:
+                writer.start('Definition')
+                writer.element('SubtypeId', text=cb.SubtypeId)
+                writer.element('DisplayName', text=cb.DisplayName)
+                writer.element('CubeSize', text=cb.CubeSize)
+
+                writer.start('Components')
+                for component in cb.Components:
+                    writer.element('Component', {'Subtype': component.Subtype, 'Count': str(component.Count)})
+                writer.end()
+                writer.end()
+            writer.end()
+
+            writer.end()
     except Exception as e:
         print(f"Error writing to output file: {e}")
+        return False
+    return True
 
 if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Build the Database file from the game and mod folders.")
+    add_profile_arguments(argument_parser)
+    report_file = start_profiling(argument_parser.parse_args(), __file__)
+
     output_file = os.path.join(os.path.dirname(__file__), 'parsedData.xml')
+    manifest_file = os.path.join(os.path.dirname(__file__), 'parsedData.manifest') if your_incrementalRebuild_enabled else None
 
-    components, blueprints, cube_blocks = parse_sbc_files(your_gameContentData_folder, your_contentBlacklist_folder)
-    write_to_output_file(output_file, components, blueprints, cube_blocks)
+    components, blueprints, cube_blocks = parse_sbc_files(your_gameContentData_folder, your_contentBlacklist_folder, your_parsingWorkers_count, manifest_file, your_manifestHashing_enabled)
+    with profiler.stage('write_xml'):
+        if not write_to_output_file(output_file, components, blueprints, cube_blocks):
+            exit(1)
+    with profiler.stage('write_cache'):
+        write_database_cache(get_database_paths(os.path.dirname(__file__))[1], get_source_signature(output_file),
+                             components, blueprints, cube_blocks)
     print(f"Extracted data written to {output_file}")
+    finish_profiling(report_file, __file__)
@@ -0,0 +1,33 @@
+import os
+
+# Shared folder walking with a Blacklist. Blacklist paths are normalized once into a set, and blacklisted folders are
+# removed from os.walk before it descends into them, so they are never read at all (slow network drives included).
+
+def normalize_path(path):
+    return os.path.normcase(os.path.normpath(os.path.abspath(path)))
+
+def compile_blacklist(blacklist_dict):
+    return frozenset(normalize_path(path) for path in blacklist_dict.values())
+
+# Check the folder and every parent of it against the Blacklist
+def is_blacklisted(path, blacklist):
+    path = normalize_path(path)
+    while True:
+        if path in blacklist:
+            return True
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+
+# Same files and order as os.walk, without the blacklisted folders
+def walk_files(folder_path, blacklist, suffix):
+    if is_blacklisted(folder_path, blacklist):
+        return
+    for root_dir, dirs, files in os.walk(folder_path):
+        if blacklist:
+            normalized_root = normalize_path(root_dir)
+            dirs[:] = [name for name in dirs if os.path.join(normalized_root, os.path.normcase(name)) not in blacklist]
+        for filename in files:
+            if filename.endswith(suffix):
+                yield os.path.join(root_dir, filename)
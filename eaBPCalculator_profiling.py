@@ -0,0 +1,114 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+# Built-in instrumentation for the scripts. Stage timers and counters cost next to nothing while profiling is off.
+# Switch it on from the command line of any script:
+# --profile [report.json]  time every stage and count files, blocks, lookups and cache hits, written as a JSON report
+# --cprofile               add the slowest functions from cProfile to the report
+# --tracemalloc            add the peak traced memory and the largest allocations to the report
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.counters = {}
+        self.function_profile = None
+        self.trace_memory = False
+        self.start_time = None
+
+    def start(self, use_cprofile=False, use_tracemalloc=False):
+        self.enabled = True
+        self.start_time = time.perf_counter()
+        if use_tracemalloc:
+            self.trace_memory = True
+            tracemalloc.start()
+        if use_cprofile:
+            self.function_profile = cProfile.Profile()
+            self.function_profile.enable()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {'Seconds': 0.0, 'Calls': 0})
+            stage['Seconds'] += time.perf_counter() - start
+            stage['Calls'] += 1
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Add stages and counters recorded in a worker process. Stage times of parallel workers add up, so they can be
+    # more than the time the main process waited for them.
+    def merge(self, stages, counters):
+        for name, worker_stage in stages.items():
+            stage = self.stages.setdefault(name, {'Seconds': 0.0, 'Calls': 0})
+            stage['Seconds'] += worker_stage['Seconds']
+            stage['Calls'] += worker_stage['Calls']
+        for name, amount in counters.items():
+            self.count(name, amount)
+
+    def get_report(self, script_name):
+        report = {
+            'Script': script_name,
+            'TotalSeconds': time.perf_counter() - self.start_time,
+            'Stages': self.stages,
+            'Counters': self.counters
+        }
+        if self.function_profile is not None:
+            self.function_profile.disable()
+            stats = pstats.Stats(self.function_profile)
+            functions = sorted(stats.stats.items(), key=lambda entry: entry[1][3], reverse=True)[:30]
+            report['Functions'] = [{
+                'Function': f"{os.path.basename(file_name)}:{line_number}({function_name})",
+                'Calls': calls,
+                'OwnSeconds': own_seconds,
+                'CumulativeSeconds': cumulative_seconds
+            } for (file_name, line_number, function_name), (_, calls, own_seconds, cumulative_seconds, _) in functions]
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            report['TracedMemory'] = {
+                'PeakKiB': tracemalloc.get_traced_memory()[1] // 1024,
+                'Top': [{'Line': str(statistic.traceback), 'KiB': statistic.size // 1024, 'Count': statistic.count}
+                        for statistic in snapshot.statistics('lineno')[:15]]
+            }
+            tracemalloc.stop()
+        return report
+
+    def write_report(self, report_path, script_name):
+        with open(report_path, 'w', encoding='utf-8') as report_file:
+            json.dump(self.get_report(script_name), report_file, indent=4)
+        print(f"Profile report written to {report_path}")
+
+# The instance every script reports to
+profiler = Profiler()
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='REPORT',
+                        help="write stage timings and counters to a JSON report (default: <script>_profile.json)")
+    parser.add_argument('--cprofile', action='store_true', help="also profile every function with cProfile")
+    parser.add_argument('--tracemalloc', action='store_true', help="also trace memory allocations")
+
+# Returns the report path, or None when profiling stays off
+def start_profiling(args, script_path):
+    if args.profile is None and not args.cprofile and not args.tracemalloc:
+        return None
+    profiler.start(args.cprofile, args.tracemalloc)
+    if args.profile:
+        return args.profile
+    script_name = os.path.splitext(os.path.basename(script_path))[0]
+    return os.path.join(os.path.dirname(os.path.abspath(script_path)), f"{script_name}_profile.json")
+
+def finish_profiling(report_path, script_path):
+    if report_path is not None:
+        profiler.write_report(report_path, os.path.basename(script_path))
@@ -0,0 +1,147 @@
+import os
+import csv
+import json
+from eaBPCalculator_atomicFile import atomic_write, get_temp_path, remove_temp_file
+
+# Flat output rows of (grid, subtype, typeId, amount), as CSV, JSON Lines or Parquet. Rows are written grid by grid
+# while the export runs, so nothing has to be kept around for a nested document. Total rows have an empty grid.
+# Parquet needs pyarrow. Without it installed, use CSV or JSON Lines instead.
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+ROW_FIELDS = ('grid', 'subtype', 'typeId', 'amount')
+ROW_FORMATS = {'csv': '.csv', 'jsonl': '.jsonl', 'parquet': '.parquet'}
+OUTPUT_FORMATS = ('xml',) + tuple(ROW_FORMATS)
+# Parquet rows are collected up to this number before a row group is written
+PARQUET_GROUP_ROWS = 65536
+
+def parquet_available():
+    return pyarrow is not None
+
+# Stop right away, before any work is done, when Parquet is asked for without pyarrow
+def check_output_format(output_format):
+    if output_format == 'parquet' and not parquet_available():
+        print("Parquet output needs pyarrow, which is not installed. Use csv or jsonl instead.")
+        exit(1)
+
+def get_output_path(output_dir, name, output_format):
+    return os.path.join(output_dir, name + ROW_FORMATS.get(output_format, '.xml'))
+
+# Shared by the writers below. Their write_grid takes the (subtype, typeId, amount) rows of one grid, grid None for the Total.
+# Rows go to a temporary file which only replaces the output once the export is done, an export that fails on the way
+# throws it away and keeps the previous output.
+class RowWriter:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.discard(*exc_info)
+
+    def open_output(self, output_path, **kwargs):
+        self.output = atomic_write(output_path, 'w', **kwargs)
+        self.output_file = self.output.__enter__()
+
+    def close(self):
+        self.output.__exit__(None, None, None)
+
+    def discard(self, *exc_info):
+        self.output.__exit__(*exc_info)
+
+class CsvRowWriter(RowWriter):
+    def __init__(self, output_path):
+        self.open_output(output_path, encoding='utf-8', newline='')
+        self.writer = csv.writer(self.output_file)
+        self.writer.writerow(ROW_FIELDS)
+
+    def write_grid(self, grid, rows):
+        grid = '' if grid is None else grid
+        self.writer.writerows((grid, subtype, type_id, amount) for subtype, type_id, amount in rows)
+
+class JsonLinesRowWriter(RowWriter):
+    def __init__(self, output_path):
+        self.open_output(output_path, encoding='utf-8')
+
+    def write_grid(self, grid, rows):
+        for subtype, type_id, amount in rows:
+            self.output_file.write(json.dumps({'grid': grid, 'subtype': subtype, 'typeId': type_id, 'amount': amount}) + '\n')
+
+class ParquetRowWriter(RowWriter):
+    def __init__(self, output_path):
+        self.schema = pyarrow.schema([
+            ('grid', pyarrow.string()),
+            ('subtype', pyarrow.string()),
+            ('typeId', pyarrow.string()),
+            ('amount', pyarrow.float64())
+        ])
+        self.output_path = output_path
+        self.temp_path = get_temp_path(output_path)
+        self.writer = pq.ParquetWriter(self.temp_path, self.schema)
+        self.columns = {field: [] for field in ROW_FIELDS}
+
+    def write_grid(self, grid, rows):
+        for subtype, type_id, amount in rows:
+            self.columns['grid'].append(grid)
+            self.columns['subtype'].append(subtype)
+            self.columns['typeId'].append(type_id)
+            self.columns['amount'].append(float(amount))
+        if len(self.columns['grid']) >= PARQUET_GROUP_ROWS:
+            self.flush()
+
+    def flush(self):
+        if self.columns['grid']:
+            self.writer.write_table(pyarrow.table(self.columns, schema=self.schema))
+            self.columns = {field: [] for field in ROW_FIELDS}
+
+    def close(self):
+        try:
+            self.flush()
+            self.writer.close()
+            os.replace(self.temp_path, self.output_path)
+        except BaseException:
+            self.discard()
+            raise
+
+    def discard(self, *exc_info):
+        try:
+            self.writer.close()
+        finally:
+            remove_temp_file(self.temp_path)
+
+def open_row_writer(output_path, output_format):
+    if output_format == 'csv':
+        return CsvRowWriter(output_path)
+    if output_format == 'jsonl':
+        return JsonLinesRowWriter(output_path)
+    if output_format == 'parquet':
+        check_output_format(output_format)
+        return ParquetRowWriter(output_path)
+    raise ValueError(f"Unknown row format: {output_format}")
+
+# Read rows back as (grid, subtype, typeId, amount), the format is taken from the file extension
+def read_rows(input_path):
+    extension = os.path.splitext(input_path)[1].lower()
+    if extension == '.csv':
+        with open(input_path, 'r', encoding='utf-8', newline='') as input_file:
+            for row in csv.DictReader(input_file):
+                yield row['grid'] or None, row['subtype'], row['typeId'], float(row['amount'])
+    elif extension == '.jsonl':
+        with open(input_path, 'r', encoding='utf-8') as input_file:
+            for line in input_file:
+                if line.strip():
+                    row = json.loads(line)
+                    yield row['grid'], row['subtype'], row['typeId'], row['amount']
+    elif extension == '.parquet':
+        if not parquet_available():
+            print("Reading Parquet needs pyarrow, which is not installed.")
+            exit(1)
+        for batch in pq.ParquetFile(input_path).iter_batches(columns=list(ROW_FIELDS)):
+            columns = batch.to_pydict()
+            yield from zip(columns['grid'], columns['subtype'], columns['typeId'], columns['amount'])
+    else:
+        raise ValueError(f"Unknown row file: {input_path}")
@@ -0,0 +1,203 @@
+import os
+import json
+import asyncio
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+from eaBPCalculator_database import get_database_paths, get_source_signature
+from eaBPCalculator_exportBPComps import parse_input_files, parse_component_counts
+from eaBPCalculator_exportBPMats import calculate_totals
+from eaBPCalculator_state import load_state
+
+# Calculator service: keeps the Database and both indexes warm in memory and answers over local HTTP, on a TCP port
+# or a Unix socket. The Database is reloaded as soon as "parsedData.xml" changes on disk.
+# Example:
+# python eaBPCalculator_service.py --port 8765
+# POST /calculate  with JSON {"path": "<blueprint folder or bp.sbc>"}, or with the bp.sbc file itself as the body
+# GET  /status     shows which Database is loaded
+# The answer lists the Components and Materials per grid DisplayName, plus both totals.
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 411: 'Length Required',
+           413: 'Payload Too Large', 422: 'Unprocessable Entity', 500: 'Internal Server Error'}
+MAX_BODY_BYTES = 1 << 30
+# Uploaded bp.sbc files are kept in memory up to this size, bigger ones are spooled to a temporary file
+SPOOL_BYTES = 16 << 20
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# The grid cache only lives for one request, so uploads of many different blueprints do not keep memory growing
+def calculate_blueprint(state, input_files):
+    counts = {}
+    grid_cache = {}
+    for input_file in input_files:
+        counts = parse_component_counts(input_file, state['BlockIndex'], counts, True, grid_cache)
+    categorized_totals, total = calculate_totals(counts, state['RecipeIndex'], state['ExpansionCache'])
+
+    total_counts = {}
+    for components in counts.values():
+        for subtype, count in components.items():
+            total_counts[subtype] = total_counts.get(subtype, 0) + count
+    return {
+        'Components': counts,
+        'ComponentsTotal': total_counts,
+        'Materials': categorized_totals,
+        'MaterialsTotal': total
+    }
+
+# Reload the Database if "parsedData.xml" changed since it was loaded. Requests already running keep the old state.
+# A file which failed to load is only tried again once it changes, the loaded Database is kept until then.
+def needs_reload(service, signature):
+    return signature != service['State']['Signature'] and signature != service['FailedSignature']
+
+async def refresh_state(service):
+    try:
+        signature = get_source_signature(service['DatabasePath'])
+    except OSError as e:
+        print(f"Database file not readable, keeping the loaded one: {e}")
+        return service['State']
+    if needs_reload(service, signature):
+        async with service['ReloadLock']:
+            if needs_reload(service, signature):
+                loop = asyncio.get_running_loop()
+                try:
+                    service['State'] = await loop.run_in_executor(None, load_state, service['DatabasePath'], service['CachePath'])
+                    print("Database changed on disk and was reloaded.")
+                except Exception as e:
+                    # Half written by the parsing script, or a hand edit which is not valid
+                    service['FailedSignature'] = signature
+                    print(f"Database could not be reloaded, keeping the loaded one until the file changes again: {e}")
+    return service['State']
+
+async def read_headers(reader):
+    request_line = await reader.readline()
+    try:
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise RequestError(400, "Malformed request line.")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return method, target.split('?', 1)[0], headers
+
+# Copy the request body into a spooled file, so large uploads never sit in memory as a whole
+async def read_body(reader, headers):
+    if 'content-length' not in headers:
+        raise RequestError(411, "Content-Length is required.")
+    try:
+        remaining = int(headers['content-length'])
+    except ValueError:
+        raise RequestError(400, "Content-Length is not a number.")
+    if remaining > MAX_BODY_BYTES:
+        raise RequestError(413, f"Request body is larger than {MAX_BODY_BYTES} bytes.")
+    body_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    while remaining > 0:
+        chunk = await reader.read(min(remaining, 1 << 20))
+        if not chunk:
+            raise RequestError(400, "Request body ended early.")
+        body_file.write(chunk)
+        remaining -= len(chunk)
+    body_file.seek(0)
+    return body_file
+
+def find_request_files(path):
+    if os.path.isdir(path):
+        return parse_input_files({'blueprintFolder': path}, {})
+    if os.path.isfile(path):
+        return [path]
+    raise RequestError(404, f"Blueprint not found: {path}")
+
+async def handle_request(service, method, target, headers, reader):
+    if target == '/status':
+        state = await refresh_state(service)
+        return {'Database': service['DatabasePath'], 'Signature': state['Signature']}
+    if target != '/calculate':
+        raise RequestError(404, f"Unknown path: {target}")
+    if method != 'POST':
+        raise RequestError(405, "Use POST for /calculate.")
+
+    body_file = await read_body(reader, headers)
+    with body_file:
+        if headers.get('content-type', '').split(';')[0].strip() == 'application/json':
+            try:
+                path = json.loads(body_file.read())['path']
+            except (ValueError, KeyError, TypeError):
+                path = None
+            if not isinstance(path, str):
+                raise RequestError(400, "Expected a JSON body like {\"path\": \"<blueprint folder or bp.sbc>\"}.")
+            # Walking the folder can be slow on network drives, so it does not run on the event loop
+            input_files = await asyncio.get_running_loop().run_in_executor(None, find_request_files, path)
+        else:
+            input_files = [body_file]
+
+        state = await refresh_state(service)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, calculate_blueprint, state, input_files)
+        except ET.ParseError as e:
+            raise RequestError(422, f"Blueprint is not valid XML: {e}")
+
+async def handle_connection(service, reader, writer):
+    try:
+        method, target, headers = await read_headers(reader)
+        status, payload = 200, await handle_request(service, method, target, headers, reader)
+    except RequestError as e:
+        status, payload = e.status, {'Error': str(e)}
+    except Exception as e:
+        print(f"Error handling request: {e}")
+        status, payload = 500, {'Error': str(e)}
+
+    body = json.dumps(payload).encode('utf-8')
+    writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+    try:
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def serve(db_file_path, cache_file_path, host, port, unix_socket=None):
+    service = {
+        'DatabasePath': db_file_path,
+        'CachePath': cache_file_path,
+        'State': load_state(db_file_path, cache_file_path),
+        'FailedSignature': None,
+        'ReloadLock': asyncio.Lock()
+    }
+
+    async def handler(reader, writer):
+        await handle_connection(service, reader, writer)
+
+    if unix_socket:
+        server = await asyncio.start_unix_server(handler, path=unix_socket)
+        print(f"Calculator service listening on {unix_socket}")
+    else:
+        server = await asyncio.start_server(handler, host, port)
+        print(f"Calculator service listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Serve component and material totals with the Database kept in memory.")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on")
+    parser.add_argument('--port', type=int, default=8765, help="TCP port to listen on")
+    parser.add_argument('--unix-socket', help="listen on this Unix socket instead of a TCP port")
+    args = parser.parse_args()
+
+    db_file_path, cache_file_path = get_database_paths(script_dir)
+    if not os.path.exists(db_file_path):
+        print("Database file 'parsedData.xml' not found. Stopping execution.")
+        exit(1)
+    try:
+        asyncio.run(serve(db_file_path, cache_file_path, args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+from eaBPCalculator_database import get_source_signature, load_database
+from eaBPCalculator_exportBPComps import build_block_index
+from eaBPCalculator_exportBPMats import build_recipe_index, new_expansion_cache
+
+# Everything the long-running modes (service and watch) keep in memory, loaded together so a reload can swap it in one step
+
+def load_state(db_file_path, cache_file_path):
+    signature = get_source_signature(db_file_path)
+    components, blueprints, cube_blocks = load_database(db_file_path, cache_file_path)
+    return {
+        'Signature': signature,
+        'BlockIndex': build_block_index(cube_blocks),
+        'RecipeIndex': build_recipe_index(components, blueprints),
+        'ExpansionCache': new_expansion_cache()
+    }
@@ -0,0 +1,121 @@
+from eaBPCalculator_exportBPMats import get_component_info, expand_recipe
+
+# Optional NumPy backend. Both steps of the calculation are linear maps, so the indexes are turned into matrices once:
+# Block -> Component counts and Component -> raw materials per unit. A whole set of grids is then evaluated with one
+# matrix product per step. Results match the pure Python functions within float tolerance, only the order of
+# entries inside a grid can differ. Without NumPy installed, use parse_component_counts and calculate_totals instead.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def numpy_available():
+    return np is not None
+
+# Block -> Component matrix over every key of the Block index, (SubtypeId, CubeSize) keys included.
+# Components listed with a zero count are tracked in 'Present', so they still show up like in the pure Python path.
+def build_block_matrix(block_index):
+    block_rows = {key: row for row, key in enumerate(block_index)}
+    component_columns = {}
+    for component_counts in block_index.values():
+        for subtype in component_counts:
+            component_columns.setdefault(subtype, len(component_columns))
+
+    matrix = np.zeros((len(block_rows), len(component_columns)), dtype=np.int64)
+    present = np.zeros(matrix.shape, dtype=bool)
+    for key, row in block_rows.items():
+        for subtype, count in block_index[key].items():
+            matrix[row, component_columns[subtype]] = count
+            present[row, component_columns[subtype]] = True
+    return {'Rows': block_rows, 'Columns': list(component_columns), 'Matrix': matrix, 'Present': present}
+
+# Component -> raw materials per unit, from the fully expanded recipes
+def build_material_matrix(recipe_index, expansion_cache):
+    component_rows = {}
+    material_columns = {}
+    material_types = []
+    expanded_recipes = []
+    for subtype_id, (_, recipe) in recipe_index.items():
+        if not recipe or recipe['ResultAmount'] is None:
+            continue
+        materials = expand_recipe(recipe_index, subtype_id, expansion_cache)
+        for material_subtype, (material_type, _) in materials.items():
+            if material_subtype not in material_columns:
+                material_columns[material_subtype] = len(material_columns)
+                material_types.append(material_type)
+        component_rows[subtype_id] = len(component_rows)
+        expanded_recipes.append(materials)
+
+    matrix = np.zeros((len(component_rows), len(material_columns)), dtype=np.float64)
+    present = np.zeros(matrix.shape, dtype=bool)
+    for row, materials in enumerate(expanded_recipes):
+        for material_subtype, (_, amount) in materials.items():
+            matrix[row, material_columns[material_subtype]] = amount
+            present[row, material_columns[material_subtype]] = True
+    return {'Rows': component_rows, 'Columns': list(material_columns), 'Types': material_types, 'Matrix': matrix, 'Present': present}
+
+# Same result as parse_component_counts over the grids from read_grid_blocks/stream_grid_blocks
+def compute_component_counts(grids, block_matrix, counts=None):
+    if counts is None:
+        counts = {}
+    grid_rows = {}
+    for display_name, _, _ in grids:
+        grid_rows.setdefault(display_name, len(grid_rows))
+
+    histogram = np.zeros((len(grid_rows), len(block_matrix['Rows'])), dtype=np.int64)
+    for display_name, grid_size, block_counts in grids:
+        for subtype_name, block_count in block_counts.items():
+            block_row = block_matrix['Rows'].get((subtype_name, grid_size))
+            if block_row is None:
+                block_row = block_matrix['Rows'].get(subtype_name)
+            if block_row is None:
+                print(f"No match found for block: {subtype_name}")
+                continue
+            histogram[grid_rows[display_name], block_row] += block_count
+
+    component_counts = histogram @ block_matrix['Matrix']
+    present = (histogram > 0).astype(np.int64) @ block_matrix['Present'].astype(np.int64) > 0
+    columns = block_matrix['Columns']
+    for display_name, row in grid_rows.items():
+        for column in np.flatnonzero(present[row]):
+            if display_name not in counts:
+                counts[display_name] = {}
+            grid_counts = counts[display_name]
+            subtype = columns[column]
+            grid_counts[subtype] = grid_counts.get(subtype, 0) + int(component_counts[row, column])
+    return counts
+
+# Same result as calculate_totals, with every grid's materials computed in one matrix product
+def calculate_totals_vectorized(counts, recipe_index, material_matrix):
+    component_rows = material_matrix['Rows']
+    grid_counts = np.zeros((len(counts), len(component_rows)), dtype=np.float64)
+    grid_components = np.zeros(grid_counts.shape, dtype=bool)
+    for grid_row, components in enumerate(counts.values()):
+        for subtype, count in components.items():
+            if subtype not in component_rows:
+                display_name, recipe = get_component_info(recipe_index, subtype)
+                if not recipe:
+                    print(f"No matching Blueprint for Component: {display_name}")
+                else:
+                    print(f"No result amount found for Blueprint: {display_name}")
+                continue
+            grid_counts[grid_row, component_rows[subtype]] += count
+            grid_components[grid_row, component_rows[subtype]] = True
+
+    amounts = grid_counts @ material_matrix['Matrix']
+    present = grid_components.astype(np.int64) @ material_matrix['Present'].astype(np.int64) > 0
+    columns = material_matrix['Columns']
+    types = material_matrix['Types']
+
+    categorized_totals = {}
+    for grid_row, name in enumerate(counts):
+        categorized_totals[name] = {
+            columns[column]: {'TypeId': types[column], 'Amount': float(amounts[grid_row, column])}
+            for column in np.flatnonzero(present[grid_row])
+        }
+    total_amounts = amounts.sum(axis=0)
+    total = {
+        columns[column]: {'TypeId': types[column], 'Amount': float(total_amounts[column])}
+        for column in np.flatnonzero(present.any(axis=0))
+    }
+    return categorized_totals, total
@@ -0,0 +1,182 @@
+import os
+import time
+import argparse
+import xml.etree.ElementTree as ET
+from eaBPCalculator_database import get_database_paths, get_source_signature
+from eaBPCalculator_parsingPart import get_file_signature
+from eaBPCalculator_exportBPComps import parse_input_files, parse_component_counts, write_output_file
+from eaBPCalculator_exportBPComps import your_gameBlueprint_folder, your_contentBlacklist_folder, your_streamingBlueprint_parsing
+from eaBPCalculator_exportBPMats import calculate_totals, write_output
+from eaBPCalculator_state import load_state
+
+# Watch mode: keeps the Database, the indexes and the component counts of every bp.sbc in memory and rewrites
+# "exportComponents.xml" and "exportMaterials.xml" as soon as a blueprint is saved. Only the changed bp.sbc files are
+# read again, their old counts are taken out of the totals and the new ones added, and the materials are recalculated
+# only for the grids those files touched. The folders are polled, which needs nothing outside the standard library.
+# Example:
+# python eaBPCalculator_watch.py --interval 0.5
+
+# Seconds between two looks at the blueprint folders
+your_watchPolling_interval = 0.5
+
+def new_watch_state():
+    return {
+        'Files': {},
+        'Counts': {},
+        'References': {},
+        'Total': {},
+        'TotalReferences': {},
+        'Materials': {}
+    }
+
+# Add (sign 1) or take out (sign -1) the counts of one file. References count how many files list a Component for a
+# grid, so a Component is only dropped once no file lists it anymore, even when its count is zero.
+def apply_file_counts(watch, file_counts, sign):
+    for display_name, components in file_counts.items():
+        grid_counts = watch['Counts'].setdefault(display_name, {})
+        grid_references = watch['References'].setdefault(display_name, {})
+        for subtype, count in components.items():
+            grid_counts[subtype] = grid_counts.get(subtype, 0) + sign * count
+            grid_references[subtype] = grid_references.get(subtype, 0) + sign
+            watch['Total'][subtype] = watch['Total'].get(subtype, 0) + sign * count
+            watch['TotalReferences'][subtype] = watch['TotalReferences'].get(subtype, 0) + sign
+            if grid_references[subtype] == 0:
+                del grid_counts[subtype]
+                del grid_references[subtype]
+            if watch['TotalReferences'][subtype] == 0:
+                del watch['Total'][subtype]
+                del watch['TotalReferences'][subtype]
+        if not grid_references:
+            del watch['Counts'][display_name]
+            del watch['References'][display_name]
+    return set(file_counts)
+
+# The kept counts in the order a full run would list them: files in folder order, then grids and Components in the
+# order they first show up. The Total follows the finished grids one by one, like write_output_file builds it.
+def get_ordered_counts(watch, input_files):
+    ordered_counts = {}
+    for input_file in input_files:
+        if input_file not in watch['Files']:
+            continue
+        for display_name, components in watch['Files'][input_file][1].items():
+            grid_counts = ordered_counts.setdefault(display_name, {})
+            for subtype in components:
+                if subtype not in grid_counts:
+                    grid_counts[subtype] = watch['Counts'][display_name][subtype]
+
+    ordered_total = {}
+    for components in ordered_counts.values():
+        for subtype in components:
+            if subtype not in ordered_total:
+                ordered_total[subtype] = watch['Total'][subtype]
+    return ordered_counts, ordered_total
+
+# Materials of the touched grids only. The material Total is summed again from the grids instead of being updated
+# in place, so repeated saves never pile up float rounding errors.
+def update_materials(watch, state, display_names):
+    for display_name in display_names:
+        if display_name in watch['Counts']:
+            categorized_totals, _ = calculate_totals({display_name: watch['Counts'][display_name]},
+                                                     state['RecipeIndex'], state['ExpansionCache'])
+            watch['Materials'][display_name] = categorized_totals[display_name]
+        else:
+            watch['Materials'].pop(display_name, None)
+
+    categorized_totals = {display_name: watch['Materials'][display_name] for display_name in watch['Counts']}
+    total = {}
+    for materials in categorized_totals.values():
+        for subtype, info in materials.items():
+            if subtype not in total:
+                total[subtype] = {'TypeId': info['TypeId'], 'Amount': 0}
+            total[subtype]['Amount'] += info['Amount']
+    return categorized_totals, total
+
+# Read the new or changed bp.sbc files again and drop the deleted ones. Returns the number of files that changed.
+# The grid cache only lives for one rescan, so a long session of saves does not keep memory growing.
+def rescan(watch, state, blueprint_folders, blacklist_folders, streaming=True):
+    input_files = parse_input_files(blueprint_folders, blacklist_folders)
+    changed_files = 0
+    touched = set()
+    grid_cache = {}
+
+    for input_file in input_files:
+        try:
+            signature = get_file_signature(input_file, False)
+        except OSError:
+            continue
+        old = watch['Files'].get(input_file)
+        if old is not None and old[0] == signature:
+            continue
+        try:
+            file_counts = parse_component_counts(input_file, state['BlockIndex'], {}, streaming, grid_cache)
+        except (ET.ParseError, OSError) as e:
+            # Most likely the game is still writing the file, it is read again on the next poll
+            print(f"Could not read {input_file}, trying again: {e}")
+            continue
+        # New counts first, so Components listed before and after keep their place in the output
+        touched |= apply_file_counts(watch, file_counts, 1)
+        if old is not None:
+            touched |= apply_file_counts(watch, old[1], -1)
+        watch['Files'][input_file] = (signature, file_counts)
+        changed_files += 1
+
+    for input_file in set(watch['Files']) - set(input_files):
+        touched |= apply_file_counts(watch, watch['Files'].pop(input_file)[1], -1)
+        changed_files += 1
+
+    if changed_files:
+        watch['Counts'], watch['Total'] = get_ordered_counts(watch, input_files)
+        watch['CategorizedTotals'], watch['MaterialsTotal'] = update_materials(watch, state, touched)
+    return changed_files
+
+def write_outputs(watch, components_path, materials_path):
+    write_output_file(watch['Counts'], components_path, watch['Total'])
+    write_output(watch['CategorizedTotals'], watch['MaterialsTotal'], materials_path)
+
+def watch_blueprints(db_file_path, cache_file_path, components_path, materials_path, interval, streaming=True):
+    state = load_state(db_file_path, cache_file_path)
+    failed_signature = None
+    watch = new_watch_state()
+    print(f"Watching the blueprint folders every {interval} s, press Ctrl+C to stop.")
+    while True:
+        start = time.perf_counter()
+        try:
+            signature = get_source_signature(db_file_path)
+        except OSError:
+            signature = state['Signature']
+        if signature != state['Signature'] and signature != failed_signature:
+            # Block and recipe definitions changed, so every blueprint is counted again
+            try:
+                state = load_state(db_file_path, cache_file_path)
+                watch = new_watch_state()
+                print("Database changed on disk and was reloaded.")
+            except Exception as e:
+                # Half written by the parsing script, or a hand edit which is not valid. The loaded Database is kept
+                # and the reload is only tried again once the file changes.
+                failed_signature = signature
+                print(f"Database could not be reloaded, keeping the loaded one until the file changes again: {e}")
+
+        changed_files = rescan(watch, state, your_gameBlueprint_folder, your_contentBlacklist_folder, streaming)
+        if changed_files:
+            write_outputs(watch, components_path, materials_path)
+            print(f"Updated {changed_files} blueprint file(s) in {(time.perf_counter() - start) * 1000:.1f} ms")
+        time.sleep(interval)
+
+def main():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Rewrite the component and material exports whenever a blueprint is saved.")
+    parser.add_argument('--interval', type=float, default=your_watchPolling_interval, help="seconds between two polls")
+    args = parser.parse_args()
+
+    db_file_path, cache_file_path = get_database_paths(script_dir)
+    if not os.path.exists(db_file_path):
+        print("Database file 'parsedData.xml' not found. Stopping execution.")
+        exit(1)
+    try:
+        watch_blueprints(db_file_path, cache_file_path, os.path.join(script_dir, "exportComponents.xml"),
+                         os.path.join(script_dir, "exportMaterials.xml"), args.interval, your_streamingBlueprint_parsing)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# Streaming XML writer shared by the scripts. Elements are written to the file as soon as they are added, with the
+# same layout minidom's toprettyxml produced before, so neither the whole document nor a DOM is kept in memory.
+
+def escape_xml(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+def format_attributes(attrib):
+    if not attrib:
+        return ''
+    return ''.join(f' {name}="{escape_xml(value)}"' for name, value in attrib.items())
+
+class IndentedXmlWriter:
+    def __init__(self, output_file, indent="    "):
+        self.output_file = output_file
+        self.indent = indent
+        self.open_tags = []
+        self.start_tag_open = False
+        output_file.write('<?xml version="1.0" ?>\n')
+
+    # Finish the last start tag, now that it is known to have children
+    def close_start_tag(self):
+        if self.start_tag_open:
+            self.output_file.write('>\n')
+            self.start_tag_open = False
+
+    def start(self, tag, attrib=None):
+        self.close_start_tag()
+        self.output_file.write(f'{self.indent * len(self.open_tags)}<{tag}{format_attributes(attrib)}')
+        self.open_tags.append(tag)
+        self.start_tag_open = True
+
+    def end(self):
+        tag = self.open_tags.pop()
+        if self.start_tag_open:
+            self.output_file.write('/>\n')
+            self.start_tag_open = False
+        else:
+            self.output_file.write(f'{self.indent * len(self.open_tags)}</{tag}>\n')
+
+    # Element without children, with optional text
+    def element(self, tag, attrib=None, text=None):
+        self.close_start_tag()
+        indent = self.indent * len(self.open_tags)
+        if text:
+            self.output_file.write(f'{indent}<{tag}{format_attributes(attrib)}>{escape_xml(text)}</{tag}>\n')
+        else:
+            self.output_file.write(f'{indent}<{tag}{format_attributes(attrib)}/>\n')